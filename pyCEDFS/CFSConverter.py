@@ -48,7 +48,11 @@ from dateutil.tz import tzlocal
 import numpy as np
 
 import pyCEDFS
+from pyCEDFS.reader import CFSReader
+from pyCEDFS.validation import validate
 
+from hdmf.data_utils import AbstractDataChunkIterator, DataChunk
+from hdmf.backends.hdf5.h5_utils import H5DataIO
 from pynwb.device import Device
 from pynwb import NWBHDF5IO, NWBFile
 from pynwb.icephys import IntracellularElectrode
@@ -69,6 +73,71 @@ from x_to_nwb.conversion_utils import (
 
 log = logging.getLogger(__name__)
 
+#Placeholder for the cycle id in the precomputed series descriptions
+CYCLE_ID_TOKEN = "__cycle_id__"
+CYCLE_ID_JSON = json.dumps(CYCLE_ID_TOKEN)
+#Placeholder for the per sweep data digest
+DIGEST_TOKEN = "__sweep_digest__"
+DIGEST_JSON = json.dumps(DIGEST_TOKEN)
+#Placeholder for the digest of the series data as written to the NWB file
+DATA_DIGEST_TOKEN = "__data_digest__"
+DATA_DIGEST_JSON = json.dumps(DATA_DIGEST_TOKEN)
+
+
+class SweepChunkIterator(AbstractDataChunkIterator):
+    """
+    Data of one sweep of one channel, read from the file in blocks of `bufferSize` points while h5py writes the
+    dataset. Only one block of the sweep is in memory at a time. Blocks are float32, like the arrays convertDataset
+    writes for the in-memory conversion.
+    ______
+    Init:
+    reader -> An open CFSReader for the file
+    channel, sweep -> The channel and (0-indexed) sweep to read
+    bufferSize -> Number of points read per block
+    scale -> Factor applied to each scaled block, e.g. the stimulus scale factor
+    """
+
+    def __init__(self, reader, channel, sweep, bufferSize, scale=1.0):
+        if bufferSize < 1:
+            raise ValueError("bufferSize must be at least 1")
+        self.reader = reader
+        self.channel = channel
+        self.sweep = sweep
+        self.bufferSize = int(bufferSize)
+        self.scale = scale
+        self._points = int(reader.datasetChaVars[channel][sweep]['points'])
+        self._pos = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._pos >= self._points:
+            raise StopIteration
+        _, y = self.reader.read_block(self.channel, self.sweep, self._pos, self.bufferSize)
+        if not len(y):
+            raise StopIteration
+        if self.scale != 1.0:
+            y = y * self.scale
+        selection = np.s_[self._pos:self._pos + len(y)]
+        self._pos += len(y)
+        #scale before the cast, in the same order as the in-memory path
+        return DataChunk(data=y.astype(np.float32), selection=selection)
+
+    def recommended_chunk_shape(self):
+        return (min(self.bufferSize, max(self._points, 1)),)
+
+    def recommended_data_shape(self):
+        return (self._points,)
+
+    @property
+    def dtype(self):
+        return np.dtype(np.float32)
+
+    @property
+    def maxshape(self):
+        return (self._points,)
+
 
 class CFSConverter:
 
@@ -83,6 +152,7 @@ class CFSConverter:
         searchSettingsFile=True,
         includeChannelList=None,
         discardChannelList=None,
+        bufferSize=None,
     ):
         """
         Convert the given cfs file to NWB. By default all ADC channel are written in to the NWB file.
@@ -94,6 +164,8 @@ class CFSConverter:
         searchSettingsFile    -- Search the JSON settings file and warn if it could not be found
         includeChannelList    -- ADC channels to write into the NWB file
         discardChannelList    -- ADC channels to not write into the NWB file
+        bufferSize            -- Only load the metadata of the cfs files and stream the sweep data in blocks of this many
+                                 points, for validation and while writing. None (default) converts in memory.
         """
 
         inFiles = []
@@ -101,7 +173,7 @@ class CFSConverter:
         if os.path.isfile(inFileOrFolder):
             inFiles.append(inFileOrFolder)
         elif os.path.isdir(inFileOrFolder):
-            inFiles = glob.glob(os.path.join(inFileOrFolder, "*.cfs"))
+            inFiles = sorted(glob.glob(os.path.join(inFileOrFolder, "*.cfs")))
         else:
             raise ValueError(f"{inFileOrFolder} is neither a folder nor a path.")
 
@@ -114,6 +186,8 @@ class CFSConverter:
         self.discardChannelList = discardChannelList
 
         self.compression = compression
+        self.bufferSize = bufferSize
+        self._readers = {}
         self.globalSettingsFile = globalSettingsFile
         self.searchSettingsFile = searchSettingsFile
 
@@ -122,7 +196,8 @@ class CFSConverter:
         self.cfss = []
 
         for inFile in inFiles:
-            cfs = pyCEDFS.CFS(inFile)
+            # when streaming only the metadata is loaded, the data is read block by block for validation and writing
+            cfs = pyCEDFS.CFS(inFile, load_data=self.bufferSize is None)
             self.cfss.append(cfs)
 
             # ensure that the input file matches our expectations
@@ -148,8 +223,13 @@ class CFSConverter:
         for i in self._createAcquiredSeries(electrodes):
             nwbFile.add_acquisition(i)
 
-        with NWBHDF5IO(outFile, "w") as io:
-            io.write(nwbFile, cache_spec=True)
+        try:
+            with NWBHDF5IO(outFile, "w") as io:
+                io.write(nwbFile, cache_spec=True)
+        finally:
+            for reader in self._readers.values():
+                reader.close()
+            self._readers = {}
 
     @staticmethod
     def outputMetadata(inFile):
@@ -249,7 +329,8 @@ class CFSConverter:
         """
 
         
-        if not (cfs.sweepPointCount > 0):
+        # from the header, a CFS loaded with load_data=False has no decoded sweep
+        if not (cfs.channels > 0 and cfs.datasets > 0 and cfs.datasetChaVars[0][0]['points'] > 0):
             raise ValueError("The number of data points is not larger than zero.")
         elif not (cfs.sweepCount > 0):
             raise ValueError("Found no sweeps.")
@@ -266,19 +347,11 @@ class CFSConverter:
         else:
             channels = range(cfs.channelCount)
 
-        for sweep in range(cfs.sweepCount):
-            for channel in channels:
-                cfs.setSweep(sweep, channel=channel)
-
-                if cfs.sweepUnitsX != "sec":
-                    raise ValueError(f"Unexpected x units of {cfs.sweepUnitsX}.")
-
-                if np.isnan(cfs.sweepC).any():
-                    raise ValueError(
-                        f"Found at least one 'Not a Number' "
-                        f"entry in stimulus channel {channel} of sweep {sweep} "
-                        f"in file {cfs.cfsFilePath} using protocol {cfs.protocol}."
-                    )
+        report = validate(cfs, channels=channels)
+        for issue in report.warnings:
+            log.warning(issue.message)
+        report.raise_for_errors()
+        return report
 
     def _reduceChannelList(self, cfs, _json_settings):
         """
@@ -376,7 +449,8 @@ class CFSConverter:
         if len(session_description) == 0:
             session_description = PLACEHOLDER
 
-        identifier = sha256(" ".join([cfs.fileGUID for cfs in self.cfss]).encode()).hexdigest()
+        # sorted, so the identifier does not depend on the order the files were listed in
+        identifier = sha256(" ".join(sorted(cfs.fileGUID for cfs in self.cfss)).encode()).hexdigest()
         session_start_time = datetime.combine(
             self.refcfs.cfsDateTime.date(), self.refcfs.cfsDateTime.time(), tzinfo=tzlocal()
         )
@@ -426,6 +500,181 @@ class CFSConverter:
 
         return delta.total_seconds() + cfs.sweepX[0]
 
+    def _planFile(self, file_index, cfs, electrodes):
+        """
+        Compute everything about the series of one cfs file that does not change between sweeps: settings,
+        protocol, scale factor, and per channel the electrode, conversion, series class, amplifier settings,
+        a description template and the absolute start offsets and sampling rates of every sweep.
+        Only the data, cycle id and starting time vary per sweep afterwards.
+        """
+
+        _json_settings, jsonSource = self._findSettingsEntry(cfs)
+        log.debug(f"Using JSON settings for {jsonSource}.")
+
+        stimulus_description = CFSConverter._getProtocolName(cfs.protocol, _json_settings)
+        scale_factor = self._getScaleFactor(cfs, stimulus_description)
+        delta = (cfs.cfsDateTime - self.refcfs.cfsDateTime).total_seconds()
+        digests = cfs.digest(per_sweep=True)
+
+        def planChannel(channel, acquired):
+            first = cfs.sweep(0, channel)
+            clampMode = self._getClampMode(cfs, channel, str_mode=_json_settings['Clamp Mode'])
+            #factor between the scaled sweep and the data written: stimulus scale factor, or the uV to mV
+            #normalisation of Sweep.sweepY for acquired data
+            if acquired:
+                scale = 0.001 if 'uV' in cfs.chVars[channel]['Y Units'] else 1.0
+            else:
+                scale = scale_factor
+            description = json.dumps(
+                {
+                    "cycle_id": CYCLE_ID_TOKEN,
+                    "digest": DIGEST_TOKEN,
+                    "data_digest": DATA_DIGEST_TOKEN,
+                    "digest_algorithm": digests["algorithm"],
+                    "file_digest": digests["file"],
+                    "protocol": stimulus_description,
+                    "protocolPath": cfs.protocolPath,
+                    "file": os.path.basename(cfs.cfsFilePath),
+                    "name": cfs.chVars[channel]['Channel Name'],
+                    "number": int(cfs.chVars[channel]['Channel']),
+                },
+                sort_keys=True,
+                indent=4,
+            )
+            #absolute start times as used by setSweep(absoluteTime=True), accumulated once instead of per sweep
+            firstX, lastY = self._sweepBounds(cfs, channel)
+            offsets = np.concatenate(([0], np.cumsum(lastY)))
+            starts = delta + offsets[:cfs.sweepCount] + firstX
+            plan = {
+                "channel": channel,
+                "electrode": electrodes[channel],
+                "clampMode": clampMode,
+                "description": description,
+                "starting_times": starts,
+                "scale": scale,
+                "digests": digests["sweeps"][channel],
+                "data_digests": [self._dataDigest(cfs, channel, sweep, scale, digests["algorithm"])
+                                 for sweep in range(cfs.sweepCount)],
+                "rates": [float(rate) for rate in cfs.sampleRates[channel]],
+            }
+            if acquired:
+                plan["conversion"], _ = parseUnit(first.sweepUnitsY)
+                plan["seriesClass"] = getAcquiredSeriesClass(clampMode)
+                plan["settings"] = self._getAmplifierSettings(cfs, clampMode, cfs.chVars[channel]['Channel Name'])
+            else:
+                plan["conversion"], _ = parseUnit(first.sweepUnitsC)
+                plan["seriesClass"] = getStimulusSeriesClass(clampMode)
+            return plan
+
+        plan = {
+            "settings": _json_settings,
+            "stimulus_description": stimulus_description,
+            "scale_factor": scale_factor,
+            "stimChannels": [planChannel(channel, False) for channel in _json_settings['Stim Channels']],
+        }
+
+        channelList = self._reduceChannelList(cfs, _json_settings)
+        log.debug(f"Channel lists: original {_json_settings['Resp Channels']}, reduced {channelList}")
+        if len(channelList) == 0:
+            warnings.warn(
+                f"The channel settings {self.includeChannelList} (included) and {self.discardChannelList} (discarded) resulted "
+                f"in an empty channelList for {cfs.cfsFilePath} with the unfiltered channels being {_json_settings['Resp Channels']}."
+            )
+        plan["respChannels"] = [planChannel(channel, True) for channel in _json_settings['Resp Channels']
+                                if cfs.chVars[channel]['Channel'] in channelList]
+        return plan
+
+    def _getReader(self, cfs):
+        """
+        Return the CFSReader used to stream the data of `cfs`, opened on first use and closed after writing.
+        """
+        reader = self._readers.get(cfs.cfsFilePath)
+        if reader is None:
+            reader = self._readers[cfs.cfsFilePath] = CFSReader(cfs.cfsFilePath, poolSize=1)
+        return reader
+
+    def _sweepBounds(self, cfs, channel):
+        """
+        Return the first x value and the last y value of every sweep of a channel, read from the file if the data is
+        not loaded.
+        """
+        if cfs.dataY is not None:
+            return (np.array([cfs.dataX[channel][sweep][0] for sweep in range(cfs.sweepCount)]),
+                    np.array([y[-1] for y in cfs.dataY[channel]]))
+
+        reader = self._getReader(cfs)
+        firstX = np.empty(cfs.sweepCount)
+        lastY = np.empty(cfs.sweepCount)
+        for sweep in range(cfs.sweepCount):
+            points = cfs.datasetChaVars[channel][sweep]['points']
+            firstX[sweep] = reader.read_block(channel, sweep, 0, 1)[0][0]
+            lastY[sweep] = reader.read_block(channel, sweep, points - 1, 1)[1][0]
+        return firstX, lastY
+
+    def _seriesArray(self, cfs, channel, sweep, scale):
+        """
+        Return the float32 data of one series from the decoded sweep, the scaled sweep times `scale` like
+        convertDataset writes it.
+        """
+        data = cfs.dataY[channel][sweep]
+        if scale != 1.0:
+            data = data * scale
+        return np.asarray(data).astype(np.float32)
+
+    def _seriesBlocks(self, cfs, channel, sweep, scale):
+        """
+        Yield the float32 data of one series in the order it is written: the whole array, or the blocks of a
+        SweepChunkIterator when streaming.
+        """
+        if self.bufferSize is None:
+            yield self._seriesArray(cfs, channel, sweep, scale)
+            return
+        for chunk in SweepChunkIterator(self._getReader(cfs), channel, sweep, self.bufferSize, scale=scale):
+            yield chunk.data
+
+    def _dataDigest(self, cfs, channel, sweep, scale, algorithm):
+        """
+        Return the digest of the data of one series exactly as written to the NWB file, so that it can be compared
+        against a hash of `series.data[:]` (e.g. hashlib.blake2b(series.data[:].tobytes(), digest_size=16)).
+        When streaming the sweep is read once more for this.
+        """
+        h = pyCEDFS.pyCEDFS._new_hash(algorithm)
+        for block in self._seriesBlocks(cfs, channel, sweep, scale):
+            h.update(np.ascontiguousarray(block))
+        return h.hexdigest()
+
+    def _seriesData(self, cfs, chPlan, sweep):
+        """
+        Return the data of one series, either the decoded sweep or, when streaming, a SweepChunkIterator reading it
+        from the file during io.write. The data is multiplied by the plan's scale (see _planFile).
+        """
+        channel = chPlan["channel"]
+        if self.bufferSize is None:
+            return convertDataset(self._seriesArray(cfs, channel, sweep, chPlan["scale"]), self.compression)
+
+        iterator = SweepChunkIterator(self._getReader(cfs), channel, sweep, self.bufferSize, scale=chPlan["scale"])
+        #convertDataset casts its argument with astype, so the iterator is wrapped the same way here
+        if self.compression:
+            return H5DataIO(data=iterator, compression=True, chunks=True, shuffle=True, fletcher32=True)
+        return iterator
+
+    @staticmethod
+    def _describe(chPlan, cycle_id, sweep):
+        """
+        Return the JSON description of one series from the channel plan template.
+        """
+        description = chPlan["description"].replace(CYCLE_ID_JSON, str(cycle_id))
+        description = description.replace(DATA_DIGEST_JSON, json.dumps(chPlan["data_digests"][sweep]))
+        return description.replace(DIGEST_JSON, json.dumps(chPlan["digests"][sweep]))
+
+    def _getPlans(self, electrodes):
+        """
+        Return the per file plans (see _planFile), computed once and shared by the stimulus and acquisition series.
+        """
+        if getattr(self, "_plans", None) is None:
+            self._plans = [self._planFile(file_index, cfs, electrodes) for file_index, cfs in enumerate(self.cfss)]
+        return self._plans
+
     def _createStimulusSeries(self, electrodes):
         """
         Return a list of pynwb stimulus series objects created from the cfs file contents.
@@ -434,55 +683,29 @@ class CFSConverter:
         series = []
         counter = 0
 
-        for file_index, cfs in enumerate(self.cfss):
-
-            _json_settings, jsonSource = self._findSettingsEntry(cfs)
-            log.debug(f"Using JSON settings for {jsonSource}.")
+        for file_index, (cfs, plan) in enumerate(zip(self.cfss, self._getPlans(electrodes))):
 
-
-            stimulus_description = CFSConverter._getProtocolName(cfs.protocol, _json_settings)
-            scale_factor = self._getScaleFactor(cfs, stimulus_description)
+            stimulus_description = plan["stimulus_description"]
 
             for sweep in range(cfs.sweepCount):
                 cycle_id = int(createCycleID([file_index, sweep], total=self.totalSeriesCount))
-                for channel in _json_settings['Stim Channels']:
-
-                    cfs.setSweep(sweep, channel=channel, absoluteTime=True)
+                for chPlan in plan["stimChannels"]:
+                    channel = chPlan["channel"]
                     name, counter = createSeriesName("index", counter, total=self.totalSeriesCount)
-                    data = convertDataset(cfs.sweepC * scale_factor, self.compression)
-                    conversion, _ = parseUnit(cfs.sweepUnitsC)
-                    electrode = electrodes[channel]
-                    gain = np.nan #cfs._dacSection.fDACScaleFactor[channel]
-                    resolution = np.nan
-                    starting_time = self._calculateStartingTime(cfs)
-                    rate = float(cfs.dataRate)
-                    description = json.dumps(
-                        {
-                            "cycle_id": cycle_id,
-                            "protocol": stimulus_description,
-                            "protocolPath": cfs.protocolPath,
-                            "file": os.path.basename(cfs.cfsFilePath),
-                            "name": cfs.chVars[channel]['Channel Name'],
-                            "number": int(cfs.chVars[channel]['Channel']),
-                        },
-                        sort_keys=True,
-                        indent=4,
-                    )
-
-                    seriesClass = getStimulusSeriesClass(self._getClampMode(cfs, channel, str_mode=_json_settings['Clamp Mode']))
+                    seriesClass = chPlan["seriesClass"]
 
                     if seriesClass is not None:
                         stimulus = seriesClass(
                             name=name,
-                            data=data,
+                            data=self._seriesData(cfs, chPlan, sweep),
                             sweep_number=np.uint64(cycle_id),
-                            electrode=electrode,
-                            gain=gain,
-                            resolution=resolution,
-                            conversion=conversion,
-                            starting_time=starting_time,
-                            rate=rate,
-                            description=description,
+                            electrode=chPlan["electrode"],
+                            gain=np.nan, #cfs._dacSection.fDACScaleFactor[channel]
+                            resolution=np.nan,
+                            conversion=chPlan["conversion"],
+                            starting_time=chPlan["starting_times"][sweep],
+                            rate=chPlan["rates"][sweep],
+                            description=self._describe(chPlan, cycle_id, sweep),
                             stimulus_description=stimulus_description,
                         )
 
@@ -628,96 +851,50 @@ class CFSConverter:
         series = []
         counter = 0
 
-        for file_index, cfs in enumerate(self.cfss):
+        for file_index, (cfs, plan) in enumerate(zip(self.cfss, self._getPlans(electrodes))):
 
-            
-            _, jsonSource = self._findSettingsEntry(cfs)
-            _json_settings = _
-            log.debug(f"Using JSON settings for {jsonSource}.")
-            stimulus_description = CFSConverter._getProtocolName(cfs.protocol, _json_settings )
-            channelList = self._reduceChannelList(cfs, _json_settings)
-            log.debug(f"Channel lists: original {_json_settings['Resp Channels']}, reduced {channelList}")
-
-            if len(channelList) == 0:
-                warnings.warn(
-                    f"The channel settings {self.includeChannelList} (included) and {self.discardChannelList} (discarded) resulted "
-                    f"in an empty channelList for {cfs.cfsFilePath} with the unfiltered channels being {_json_settings['Resp Channels']}."
-                )
-                continue
+            stimulus_description = plan["stimulus_description"]
 
             for sweep in range(cfs.sweepCount):
                 cycle_id = createCycleID([file_index, sweep], total=self.totalSeriesCount)
 
-                for channel in _json_settings['Resp Channels']:
-
-                    adcName = cfs.chVars[channel]['Channel Name']
-                    adcNum = cfs.chVars[channel]['Channel']
-                    if adcNum not in channelList:
-                        continue
-
-                    cfs.setSweep(sweep, channel=channel, absoluteTime=True)
+                for chPlan in plan["respChannels"]:
+                    channel = chPlan["channel"]
                     name, counter = createSeriesName("index", counter, total=self.totalSeriesCount)
-                    data = convertDataset(cfs.sweepY, self.compression)
-                    conversion, _ = parseUnit(cfs.sweepUnitsY)
-                    electrode = electrodes[channel]
-                    gain = np.nan #cfs._adcSection.fADCProgrammableGain[channel]
-                    resolution = np.nan
-                    starting_time = self._calculateStartingTime(cfs)
-                    rate = float(cfs.dataRate)
-                    description = json.dumps(
-                        {
-                            "cycle_id": cycle_id,
-                            "protocol": stimulus_description,
-                            "protocolPath": cfs.protocolPath,
-                            "file": os.path.basename(cfs.cfsFilePath),
-                            "name": adcName,
-                            "number": int(cfs.chVars[channel]['Channel']),
-                        },
-                        sort_keys=True,
-                        indent=4,
+                    clampMode = chPlan["clampMode"]
+                    settings = chPlan["settings"]
+                    seriesClass = chPlan["seriesClass"]
+                    common = dict(
+                        name=name,
+                        data=self._seriesData(cfs, chPlan, sweep),
+                        sweep_number=np.uint64(cycle_id),
+                        electrode=chPlan["electrode"],
+                        gain=np.nan, #cfs._adcSection.fADCProgrammableGain[channel]
+                        resolution=np.nan,
+                        conversion=chPlan["conversion"],
+                        starting_time=chPlan["starting_times"][sweep],
+                        rate=chPlan["rates"][sweep],
+                        description=self._describe(chPlan, cycle_id, sweep),
+                        stimulus_description=stimulus_description,
                     )
 
-                    clampMode = self._getClampMode(cfs, channel, str_mode=_json_settings['Clamp Mode'])
-                    settings = self._getAmplifierSettings(cfs, clampMode, adcName)
-                    seriesClass = getAcquiredSeriesClass(clampMode)
-
                     if clampMode == V_CLAMP_MODE:
                         acquistion_data = seriesClass(
-                            name=name,
-                            data=data,
-                            sweep_number=np.uint64(cycle_id),
-                            electrode=electrode,
-                            gain=gain,
-                            resolution=resolution,
-                            conversion=conversion,
-                            starting_time=starting_time,
-                            rate=rate,
-                            description=description,
+                            **common,
                             capacitance_slow=settings["capacitance_slow"],
                             capacitance_fast=settings["capacitance_fast"],
                             resistance_comp_correction=settings["resistance_comp_correction"],
                             resistance_comp_bandwidth=settings["resistance_comp_bandwidth"],
                             resistance_comp_prediction=settings["resistance_comp_prediction"],
-                            stimulus_description=stimulus_description,
                             whole_cell_capacitance_comp=settings["whole_cell_capacitance_comp"],  # noqa: E501
                             whole_cell_series_resistance_comp=settings["whole_cell_series_resistance_comp"],
                         )  # noqa: E501
 
                     elif clampMode in (I_CLAMP_MODE, I0_CLAMP_MODE):
                         acquistion_data = seriesClass(
-                            name=name,
-                            data=data,
-                            sweep_number=np.uint64(cycle_id),
-                            electrode=electrode,
-                            gain=gain,
-                            resolution=resolution,
-                            conversion=conversion,
-                            starting_time=starting_time,
-                            rate=rate,
-                            description=description,
+                            **common,
                             bias_current=settings["bias_current"],
                             bridge_balance=settings["bridge_balance"],
-                            stimulus_description=stimulus_description,
                             capacitance_compensation=settings["capacitance_compensation"],
                         )
                     else:
@@ -1,2 +1,28 @@
+import importlib
+
 from .pyCEDFS import *
-from .CFSConverter import *
\ No newline at end of file
+from .reader import CFSReader
+from .handles import CFSError, CFSHandleLimitError, HandlePool
+from .export import export_store, open_store
+from . import events
+from .collection import CFSCollection
+
+#Heavier optional parts (asyncio, sqlite3 for the index, multiprocessing for shared memory, pynwb and x_to_nwb for
+#the converter) are only imported on first use
+_lazy = {
+    'aload': '.aio',
+    'aopen': '.aio',
+    'AsyncCFSReader': '.aio',
+    'CFSIndex': '.index',
+    'SharedCFS': '.shared',
+    'CFSConverter': '.CFSConverter',
+}
+
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_lazy[name], __name__), name)
+    #importing a submodule binds it on the package, rebind the name to the object (e.g. the CFSConverter class)
+    globals()[name] = value
+    return value
@@ -0,0 +1,119 @@
+"""
+asyncio wrappers around the blocking CFS readers. All DLL work is run on a bounded thread pool so the event loop is
+never blocked by parsing or decoding.
+"""
+import asyncio
+import functools
+import itertools
+import collections
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .pyCEDFS import CFS
+from .reader import CFSReader
+
+log = logging.getLogger(__name__)
+
+SweepData = collections.namedtuple('SweepData', ['sweep', 'channel', 'x', 'y'])
+
+_executor = None
+_executorLock = threading.Lock()
+DEFAULT_MAX_WORKERS = 4
+
+
+def _get_executor():
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFAULT_MAX_WORKERS, thread_name_prefix="pyCEDFS")
+        return _executor
+
+
+async def aload(cfsFilePath, executor=None, **kwargs):
+    """
+    Loads a full pyCEDFS.CFS object without blocking the event loop. kwargs are passed to CFS.
+    ______
+    executor -> concurrent.futures executor to run the load in. Defaults to a shared pool of DEFAULT_MAX_WORKERS threads
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor or _get_executor(), functools.partial(CFS, cfsFilePath, **kwargs))
+
+
+async def aopen(cfsFilePath, poolSize=2, executor=None):
+    """
+    Opens an AsyncCFSReader without blocking the event loop.
+    ______
+    poolSize -> Number of DLL handles held open by the underlying CFSReader
+    executor -> concurrent.futures executor to run reads in. Defaults to a shared pool of DEFAULT_MAX_WORKERS threads
+    """
+    executor = executor or _get_executor()
+    loop = asyncio.get_running_loop()
+    reader = await loop.run_in_executor(executor, functools.partial(CFSReader, cfsFilePath, poolSize=poolSize))
+    return AsyncCFSReader(reader, executor)
+
+
+class AsyncCFSReader(object):
+    """
+    asyncio front end for a CFSReader. Create it with `await pyCEDFS.aopen(path)`.
+    ______
+    Usage:
+    async with await pyCEDFS.aopen('debug.cfs') as reader:
+        async for sweep in reader.aiter_sweeps():
+            sweep.sweep, sweep.channel, sweep.x, sweep.y
+    """
+
+    def __init__(self, reader, executor):
+        self.reader = reader
+        self._executor = executor
+        self.chVars = reader.chVars
+        self.datasetChaVars = reader.datasetChaVars
+        self.channels = reader.channels
+        self.datasets = reader.datasets
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+        return False
+
+    def _submit(self, sweep, channel, raw):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(self.reader.read_sweep, channel, sweep, raw=raw))
+
+    async def read_sweep(self, channel, sweep, raw=False):
+        """Reads a single sweep, returns (x, y). See CFSReader.read_sweep"""
+        return await self._submit(sweep, channel, raw)
+
+    async def aiter_sweeps(self, channels=None, sweeps=None, prefetch=2, raw=False):
+        """
+        Yields SweepData(sweep, channel, x, y) in sweep then channel order, as they are decoded.
+        At most `prefetch` reads are in flight, new reads are only scheduled as the consumer pulls sweeps.
+        If the consumer stops iterating or is cancelled, reads that have not started yet are cancelled.
+        """
+        if channels is None:
+            channels = range(self.channels)
+        if sweeps is None:
+            sweeps = range(self.datasets)
+        if prefetch < 1:
+            raise ValueError("prefetch must be at least 1")
+        jobs = itertools.product(sweeps, channels)
+        pending = collections.deque()
+        try:
+            for sweep, channel in itertools.islice(jobs, prefetch):
+                pending.append((sweep, channel, self._submit(sweep, channel, raw)))
+            while pending:
+                sweep, channel, fut = pending.popleft()
+                x, y = await fut
+                for nextSweep, nextChannel in itertools.islice(jobs, 1):
+                    pending.append((nextSweep, nextChannel, self._submit(nextSweep, nextChannel, raw)))
+                yield SweepData(sweep, channel, x, y)
+        finally:
+            for _, _, fut in pending:
+                fut.cancel()
+
+    async def aclose(self):
+        """Closes the underlying reader, waiting for in-flight reads to finish."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.reader.close)
@@ -0,0 +1,122 @@
+"""
+Several CFS files presented as one recording. A cell's recording is often split over multiple files; the
+CFSCollection maps a global sweep number onto (file, sweep) and reads sweeps lazily from the file that holds them,
+so ranges of sweeps can be sliced and iterated without concatenating (and copying) the data of every file.
+"""
+import os
+import glob
+import logging
+
+import numpy as np
+
+from . import pyCEDFS as _cfs
+from .reader import CFSReader
+
+log = logging.getLogger(__name__)
+
+
+class CFSCollection(object):
+    """
+    Many CFS files as a single (channel, global sweep) space. Files are ordered by their recording time (cfsDateTime).
+    Only the metadata is read up front; sweeps are read from their file on request.
+    ______
+    Init:
+    cfsFilePaths -> A folder of .cfs files, or a list of CFS file paths
+    poolSize -> Handles kept open per file by its CFSReader
+    handlePool -> Borrow handles from this handles.HandlePool instead, so a large collection keeps at most
+                  handlePool.maxHandles files open rather than poolSize handles per file
+    ______
+    Usage:
+    with CFSCollection('Data/Cell1/') as cell:
+        x, y = cell.read_sweep(channel, 12, absoluteTime=True)
+        for globalSweep, x, y in cell[channel, 10:20]: ...
+    """
+
+    def __init__(self, cfsFilePaths, poolSize=1, handlePool=None):
+        if isinstance(cfsFilePaths, (str, os.PathLike)):
+            if not os.path.isdir(cfsFilePaths):
+                raise ValueError(f"{cfsFilePaths} is not a folder")
+            cfsFilePaths = glob.glob(os.path.join(cfsFilePaths, "*.cfs"))
+        if not cfsFilePaths:
+            raise ValueError("No CFS files given")
+        paths = sorted((os.path.abspath(p) for p in cfsFilePaths), key=lambda p: (_cfs.file_datetime(p), p))
+        self.poolSize = poolSize
+        self.handlePool = handlePool
+        self.readers = []
+        try:
+            for path in paths:
+                self.readers.append(CFSReader(path, poolSize=poolSize, handlePool=handlePool))
+        except BaseException:
+            self.close()
+            raise
+        self.cfsFilePaths = paths
+        self.cfsDateTimes = [_cfs.file_datetime(p) for p in paths]
+        self.channels = min(r.channels for r in self.readers)
+        if any(r.channels != self.channels for r in self.readers):
+            log.warning(f"Files have different channel counts, only the first {self.channels} channels are used")
+        self.chVars = self.readers[0].chVars[:self.channels]
+        counts = np.array([r.datasets for r in self.readers], dtype=np.int64)
+        #global sweep g lives in file i when sweepOffsets[i] <= g < sweepOffsets[i+1]
+        self.sweepOffsets = np.concatenate(([0], np.cumsum(counts)))
+        self.sweepCount = int(self.sweepOffsets[-1])
+        self.sweepList = np.arange(self.sweepCount)
+        self.channelList = np.arange(self.channels)
+        self.sweepStartTimes = self._start_times()
+
+    def _start_times(self):
+        """
+        Start time (seconds, relative to the first file) of every global sweep. Files start at their cfsDateTime,
+        sweeps within a file are assumed to follow each other, as CFS does not store a time per sweep.
+        """
+        ref = self.cfsDateTimes[0]
+        starts = []
+        for reader, fileTime in zip(self.readers, self.cfsDateTimes):
+            durations = np.array([d['points'] * d['xscale'] for d in reader.datasetChaVars[0]], dtype=np.float64)
+            within = np.concatenate(([0.0], np.cumsum(durations)[:-1])) if durations.size else durations
+            starts.append((fileTime - ref).total_seconds() + within)
+        return np.concatenate(starts) if starts else np.empty(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self.sweepCount
+
+    def locate(self, globalSweep):
+        """Returns (file index, sweep within that file) of a global sweep number"""
+        if not 0 <= globalSweep < self.sweepCount:
+            raise ValueError("Sweep %d not available (must be 0 - %d)" % (globalSweep, self.sweepCount-1))
+        fileIndex = int(np.searchsorted(self.sweepOffsets, globalSweep, side='right') - 1)
+        return fileIndex, int(globalSweep - self.sweepOffsets[fileIndex])
+
+    def read_sweep(self, channel, globalSweep, raw=False, absoluteTime=False):
+        """
+        Reads a global sweep of a channel from its file. Returns (x, y). With absoluteTime x is shifted by the sweep's
+        start time relative to the first file.
+        """
+        fileIndex, sweep = self.locate(globalSweep)
+        x, y = self.readers[fileIndex].read_sweep(channel, sweep, raw=raw)
+        if absoluteTime:
+            x = x + self.sweepStartTimes[globalSweep]
+        return x, y
+
+    def sweeps(self, channel, start=0, stop=None, step=1, raw=False, absoluteTime=False):
+        """Yields (global sweep, x, y) for a range of global sweeps, reading one sweep at a time"""
+        for globalSweep in range(*slice(start, stop, step).indices(self.sweepCount)):
+            x, y = self.read_sweep(channel, globalSweep, raw=raw, absoluteTime=absoluteTime)
+            yield globalSweep, x, y
+
+    def __getitem__(self, key):
+        """collection[channel, sweep] reads one sweep, collection[channel, start:stop] returns a lazy iterator"""
+        channel, sweeps = key
+        if isinstance(sweeps, slice):
+            return self.sweeps(channel, sweeps.start, sweeps.stop, sweeps.step or 1)
+        return self.read_sweep(channel, sweeps)
+
+    def close(self):
+        for reader in self.readers:
+            reader.close()
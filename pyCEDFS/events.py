@@ -0,0 +1,126 @@
+"""
+Threshold and derivative crossing detection over streamed sweep blocks. Sweeps are read in blocks of `blockSize`
+points, each block is searched with vectorized comparisons, and the last samples of a block are carried into the next
+one so crossings on block boundaries are neither missed nor reported twice. Memory use is bounded by the block size.
+"""
+import os
+import logging
+
+import numpy as np
+
+from .reader import CFSReader
+
+log = logging.getLogger(__name__)
+
+#Compact event records returned by detect_events
+EVENT_DTYPE = np.dtype([('sweep', np.int32), ('index', np.int64), ('time', np.float64), ('amplitude', np.float64)])
+
+
+def crossings(signal, threshold, direction='rising'):
+    """
+    Returns the indices i where signal crosses threshold between i-1 and i.
+    direction is 'rising', 'falling' or 'both'.
+    """
+    signal = np.asarray(signal)
+    before, after = signal[:-1], signal[1:]
+    if direction == 'rising':
+        mask = (before < threshold) & (after >= threshold)
+    elif direction == 'falling':
+        mask = (before > threshold) & (after <= threshold)
+    elif direction == 'both':
+        mask = ((before < threshold) & (after >= threshold)) | ((before > threshold) & (after <= threshold))
+    else:
+        raise ValueError(f"direction must be 'rising', 'falling' or 'both', not {direction}")
+    return np.flatnonzero(mask) + 1
+
+
+def apply_refractory(indices, refractory, last=None):
+    """
+    Drops indices closer than `refractory` points to the previously kept one. `last` is the last kept index of a
+    previous block. Returns the kept indices.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    if refractory <= 0 or not indices.size:
+        return indices
+    gaps = np.diff(indices, prepend=-refractory if last is None else last)
+    if np.all(gaps >= refractory):
+        return indices
+    #only the (few) candidates are walked in python, not the samples
+    kept = []
+    prev = -refractory if last is None else last
+    for i in indices:
+        if i - prev >= refractory:
+            kept.append(i)
+            prev = i
+    return np.array(kept, dtype=np.int64)
+
+
+def _block_source(source):
+    """Returns (read_block(channel, sweep, first, count) -> y, datasetChaVars, close)"""
+    if isinstance(source, (str, os.PathLike)):
+        reader = CFSReader(source, poolSize=1)
+        return (lambda ch, sw, first, count: reader.read_block(ch, sw, first, count)[1]), reader.datasetChaVars, reader.close
+    if isinstance(source, CFSReader):
+        return (lambda ch, sw, first, count: source.read_block(ch, sw, first, count)[1]), source.datasetChaVars, lambda: None
+    #an already loaded pyCEDFS.CFS, blocks are slices of dataY
+    return (lambda ch, sw, first, count: source.dataY[ch][sw][first:first + count]), source.datasetChaVars, lambda: None
+
+
+def detect_events(source, channel, threshold, derivative=False, direction='rising', refractory=0.0, sweeps=None,
+                  blockSize=65536):
+    """
+    Detects threshold crossings on a channel, streaming each sweep in blocks.
+    ______
+    source -> A CFS file path, a CFSReader, or a loaded pyCEDFS.CFS
+    channel -> Channel to search
+    threshold -> Level in channel units, or in channel units per X unit if derivative is True
+    derivative -> Detect crossings of dy/dx instead of y, needs a time base (xscale > 0)
+    direction -> 'rising', 'falling' or 'both'
+    refractory -> Minimum time (X units) between events of a sweep
+    sweeps -> Sweeps to search, default all
+    blockSize -> Points read per block
+    ______
+    Returns a structured array of EVENT_DTYPE (sweep, index, time, amplitude), where amplitude is y at the event index
+    and time is computed from the datasetChaVars xoffset and xscale.
+    """
+    read_block, datasetChaVars, close = _block_source(source)
+    carryLength = 2 if derivative else 1
+    events = []
+    try:
+        if sweeps is None:
+            sweeps = range(len(datasetChaVars[channel]))
+        for sweep in sweeps:
+            dsch = datasetChaVars[channel][sweep]
+            points, xscale, xoffset = dsch['points'], dsch['xscale'], dsch['xoffset']
+            if derivative and not xscale:
+                raise ValueError(f"Channel {channel} has no time base (xscale 0) in sweep {sweep}, "
+                                 f"dy/dx can not be computed")
+            refractoryPoints = int(np.ceil(refractory / xscale)) if refractory > 0 and xscale else 0
+            carry = np.empty(0)
+            last = None
+            for first in range(0, points, blockSize):
+                y = np.asarray(read_block(channel, sweep, first, blockSize), dtype=np.float64)
+                if not y.size:
+                    break
+                seg = np.concatenate((carry, y))
+                segStart = first - carry.shape[0]
+                if derivative:
+                    signal = np.diff(seg) / xscale
+                    found = crossings(signal, threshold, direction) + 1
+                else:
+                    found = crossings(seg, threshold, direction)
+                found = apply_refractory(found + segStart, refractoryPoints, last)
+                if found.size:
+                    last = int(found[-1])
+                    block = np.empty(found.shape[0], dtype=EVENT_DTYPE)
+                    block['sweep'] = sweep
+                    block['index'] = found
+                    block['time'] = xoffset + found * xscale
+                    block['amplitude'] = seg[found - segStart]
+                    events.append(block)
+                carry = seg[-carryLength:]
+    finally:
+        close()
+    if not events:
+        return np.empty(0, dtype=EVENT_DTYPE)
+    return np.concatenate(events)
@@ -0,0 +1,140 @@
+"""
+Export CFS files to chunked array stores for parallel downstream analysis, without going through the DLL or HDF5.
+Each file becomes one (channel, sweep, sample) array plus its fileVars, dsVars, chVars and datasetChaVars as attributes.
+Two store formats are supported:
+    'npy'  -> a folder with data.npy (memory-mappable with np.load(mmap_mode='r')) and an attrs.json sidecar
+    'zarr' -> a zarr group with a 'data' array chunked per (channel, sweep) and the metadata in the group attrs
+          (requires the optional zarr package)
+"""
+import os
+import glob
+import json
+import itertools
+import logging
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .reader import CFSReader
+from . import pyCEDFS as _cfs
+
+log = logging.getLogger(__name__)
+
+STORE_FORMATS = ('npy', 'zarr')
+
+
+def _json_default(obj):
+    #metadata records are mappings
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+def _jsonable(obj):
+    return json.loads(json.dumps(obj, default=_json_default))
+
+
+def export_store(inFileOrFolder, outPath, format='npy', raw=False, workers=4):
+    """
+    Exports a CFS file, or every .cfs file in a folder, to array stores.
+    ______
+    inFileOrFolder -> A CFS file or a folder of CFS files
+    outPath -> The store path for a single file, or a folder that gets one store per file (named after the file)
+    format -> 'npy' or 'zarr'
+    raw -> Store the raw integer samples instead of scaled values. The per (channel, sweep) yscale and yoffset are
+           stored in the attributes, so that data = raw * yscale + yoffset
+    workers -> Number of sweeps read and written in parallel
+    ______
+    Returns a list of the store paths written
+    """
+    if format not in STORE_FORMATS:
+        raise ValueError(f"format must be one of {STORE_FORMATS}, not {format}")
+    if os.path.isfile(inFileOrFolder):
+        return [export_file(inFileOrFolder, outPath, format=format, raw=raw, workers=workers)]
+    elif os.path.isdir(inFileOrFolder):
+        os.makedirs(outPath, exist_ok=True)
+        ext = '.zarr' if format == 'zarr' else ''
+        stores = []
+        for inFile in sorted(glob.glob(os.path.join(inFileOrFolder, "*.cfs"))):
+            name = os.path.splitext(os.path.basename(inFile))[0] + ext
+            stores.append(export_file(inFile, os.path.join(outPath, name), format=format, raw=raw, workers=workers))
+        return stores
+    else:
+        raise ValueError(f"{inFileOrFolder} is neither a folder nor a path.")
+
+
+def export_file(cfsFilePath, outPath, format='npy', raw=False, workers=4):
+    """Exports a single CFS file to an array store, see export_store. Returns outPath"""
+    if format not in STORE_FORMATS:
+        raise ValueError(f"format must be one of {STORE_FORMATS}, not {format}")
+    with CFSReader(cfsFilePath, poolSize=workers) as reader:
+        dsch = reader.datasetChaVars
+        points = np.array([[d['points'] for d in ch] for ch in dsch], dtype=np.int64).reshape(reader.channels, reader.datasets)
+        shape = (reader.channels, reader.datasets, int(points.max()) if points.size else 0)
+        if raw:
+            dtype = np.result_type(*[np.dtype(_cfs.chanDataTypes[ch['Type']]) for ch in reader.chVars])
+            fill = 0
+        else:
+            dtype = np.dtype(np.float64)
+            fill = np.nan
+        attrs = _jsonable({
+            'source': os.path.basename(reader.cfsFilePath),
+            'layout': ['channel', 'sweep', 'sample'],
+            'raw': raw,
+            'points': points,
+            'yscale': [[d['yscale'] for d in ch] for ch in dsch],
+            'yoffset': [[d['yoffset'] for d in ch] for ch in dsch],
+            'xscale': [[d['xscale'] for d in ch] for ch in dsch],
+            'xoffset': [[d['xoffset'] for d in ch] for ch in dsch],
+            'fileVars': reader.fileVars,
+            'dsVars': reader.dsVars,
+            'chVars': reader.chVars,
+            'datasetChaVars': dsch,
+        })
+
+        if format == 'zarr':
+            try:
+                import zarr
+            except ImportError:
+                raise ImportError("Exporting to zarr requires the zarr package (pip install zarr)") from None
+            root = zarr.open_group(outPath, mode='w')
+            data = root.create_dataset('data', shape=shape, chunks=(1, 1, max(shape[2], 1)), dtype=dtype, fill_value=fill)
+            root.attrs.update(attrs)
+        else:
+            os.makedirs(outPath, exist_ok=True)
+            data = np.lib.format.open_memmap(os.path.join(outPath, 'data.npy'), mode='w+', dtype=dtype, shape=shape)
+            data[:] = fill
+            with open(os.path.join(outPath, 'attrs.json'), 'w') as fh:
+                json.dump(attrs, fh, indent=4)
+
+        def write(job):
+            #each job owns a distinct (channel, sweep) chunk so writes never overlap
+            channel, sweep = job
+            _, y = reader.read_sweep(channel, sweep, raw=raw)
+            data[channel, sweep, :y.shape[0]] = y
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(write, itertools.product(range(reader.channels), range(reader.datasets))))
+        if format != 'zarr':
+            data.flush()
+            del data
+    log.debug(f"Exported {cfsFilePath} to {outPath}")
+    return outPath
+
+
+def open_store(path, mmap_mode='r'):
+    """
+    Opens a store written by export_store. Returns (data, attrs), for 'npy' stores data is a numpy memmap.
+    """
+    if os.path.isfile(os.path.join(path, 'data.npy')):
+        with open(os.path.join(path, 'attrs.json')) as fh:
+            attrs = json.load(fh)
+        return np.load(os.path.join(path, 'data.npy'), mmap_mode=mmap_mode), attrs
+    import zarr
+    root = zarr.open_group(path, mode='r')
+    return root['data'], dict(root.attrs)
@@ -0,0 +1,196 @@
+"""
+DLL file handle management. The CFS library has a small, fixed table of open files, so every handle has to be closed
+on every path, including errors. `opened` is a context manager around OpenCFSFile/CloseCFSFile, HandlePool keeps a
+bounded number of handles open across calls and closes the least recently used idle one when it needs room, and CFS
+return codes are translated into CFSError exceptions.
+"""
+import os
+import threading
+import collections
+import logging
+from contextlib import contextmanager
+
+from . import pyCEDFS as _cfs
+
+log = logging.getLogger(__name__)
+
+#Error codes returned by the CFS library (see the CFS file system manual)
+ERROR_CODES = {
+    -1: "no spare file handles",
+    -2: "file handle out of range",
+    -3: "file not open for writing",
+    -4: "file not open for editing/writing",
+    -5: "file not open for editing/reading",
+    -6: "file not open",
+    -7: "the file is not a CFS file",
+    -8: "unable to allocate the memory needed for the filing system",
+    -11: "creation of the file on disk failed",
+    -12: "opening of the file on disk failed",
+    -13: "error reading from the data file",
+    -14: "error writing to the data file",
+    -15: "error reading from the data section pointer table",
+    -16: "error writing to the data section pointer table",
+    -17: "error seeking the disk position",
+    -18: "error inserting the final data section of the file",
+    -19: "error setting the file length",
+    -20: "invalid variable description",
+    -21: "parameter out of range",
+    -22: "channel number out of range",
+    -24: "invalid data section number",
+    -25: "invalid variable kind",
+    -26: "invalid variable number",
+    -27: "data size out of range",
+    -30: "wrong CFS version number in the file",
+    -31: "wrong CFS version number in the file",
+    -32: "wrong CFS version number in the file",
+}
+
+
+class CFSError(OSError):
+    """An error code returned by the CFS library. `code` is the (negative) CFS error code"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class CFSHandleLimitError(CFSError):
+    """The CFS library has no spare file handles (code -1), close some files or use a smaller HandlePool"""
+
+
+def check(code, action, cfsFilePath=None):
+    """Returns code if it is not a CFS error code (>= 0), otherwise raises the matching CFSError"""
+    if code >= 0:
+        return code
+    reason = ERROR_CODES.get(code, "unknown error")
+    where = f" {cfsFilePath}" if cfsFilePath is not None else ""
+    cls = CFSHandleLimitError if code == -1 else CFSError
+    raise cls(code, f"Unable to {action}{where}: {reason} (CFS error code {code})")
+
+
+def open_handle(cfsFilePath):
+    """Opens a CFS file read-only and returns the DLL handle, raises CFSError on failure"""
+    cfsFilePath = os.fspath(cfsFilePath)
+    handle = _cfs.CFS64.OpenCFSFile(_cfs.ctypes.create_string_buffer(cfsFilePath.encode()), 0, 0)
+    return check(handle, "open CFS file", cfsFilePath)
+
+
+def close_handle(handle):
+    """Closes a DLL handle, raises CFSError on failure"""
+    check(_cfs.CFS64.CloseCFSFile(handle), "close CFS file handle %d" % handle)
+
+
+@contextmanager
+def opened(cfsFilePath):
+    """
+    Context manager yielding a DLL handle of a CFS file, closed on exit whether or not the block raised.
+    ______
+    Usage:
+    with opened('debug.cfs') as handle:
+        channels, dsVars, fileVars, datasets = pyCEDFS._get_file_info(handle)
+    """
+    handle = open_handle(cfsFilePath)
+    try:
+        yield handle
+    finally:
+        close_handle(handle)
+
+
+class HandlePool(object):
+    """
+    Bounded pool of open DLL handles, shared between files and threads, for workloads that revisit the same files.
+    Each acquire borrows a handle exclusively: an idle handle of the file is reused, otherwise a new one is opened,
+    closing the least recently used idle handle (of any file) if `maxHandles` are already open. When every handle is
+    borrowed, acquire waits for one to be returned.
+    ______
+    Init:
+    maxHandles -> Maximum number of handles open at once, keep it below the DLL's handle table size
+    ______
+    Usage:
+    pool = HandlePool(maxHandles=8)
+    with pool.acquire('debug.cfs') as handle:
+        ...
+    reader = CFSReader('debug.cfs', handlePool=pool)
+    pool.close()
+    """
+
+    def __init__(self, maxHandles=8):
+        if maxHandles < 1:
+            raise ValueError("maxHandles must be at least 1")
+        self.maxHandles = maxHandles
+        self._cond = threading.Condition()
+        self._idle = collections.OrderedDict() #handle -> path, least recently used first
+        self._open = 0 #handles open or being opened, idle or borrowed
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self._open
+
+    def _take(self, cfsFilePath):
+        """Returns an idle handle of the file, or None after reserving a slot for a new one. Called with the lock held"""
+        while True:
+            if self._closed:
+                raise ValueError("HandlePool is closed")
+            for handle, path in reversed(self._idle.items()):
+                if path == cfsFilePath:
+                    del self._idle[handle]
+                    return handle
+            if self._open < self.maxHandles:
+                self._open += 1
+                return None
+            if self._idle:
+                handle, path = self._idle.popitem(last=False)
+                self._open -= 1
+                log.debug(f"Evicting handle {handle} of {path}")
+                close_handle(handle)
+                continue
+            self._cond.wait()
+
+    @contextmanager
+    def acquire(self, cfsFilePath):
+        """Context manager borrowing a handle of the file, returned to the pool on exit"""
+        cfsFilePath = os.path.abspath(cfsFilePath)
+        with self._cond:
+            handle = self._take(cfsFilePath)
+        if handle is None:
+            try:
+                handle = open_handle(cfsFilePath)
+            except BaseException:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+        try:
+            yield handle
+        finally:
+            with self._cond:
+                if self._closed:
+                    self._open -= 1
+                    close_handle(handle)
+                else:
+                    self._idle[handle] = cfsFilePath
+                self._cond.notify()
+
+    def evict(self, cfsFilePath=None):
+        """Closes the idle handles of a file, or all idle handles"""
+        with self._cond:
+            path = None if cfsFilePath is None else os.path.abspath(cfsFilePath)
+            for handle, p in list(self._idle.items()):
+                if path is None or p == path:
+                    del self._idle[handle]
+                    self._open -= 1
+                    close_handle(handle)
+            self._cond.notify_all()
+
+    def close(self):
+        """Closes all idle handles, borrowed handles are closed when they are returned"""
+        with self._cond:
+            self._closed = True
+        self.evict()
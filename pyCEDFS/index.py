@@ -0,0 +1,237 @@
+"""
+SQLite-backed metadata index of a CFS archive. Walks a directory tree once, stores the header info, fileVars, dsVars,
+chVars and datasetChaVars of every file, and afterwards answers queries like "every sweep where the DS variable
+'Amplitude' is between 50 and 100" or "every file with a channel named 'Im'" without opening any CFS file.
+Re-running update() only re-reads files whose modification time or size changed.
+"""
+import os
+import sqlite3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from .reader import CFSReader
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    cfsid TEXT,
+    file_date TEXT,
+    file_time TEXT,
+    comment TEXT,
+    channels INTEGER,
+    datasets INTEGER,
+    file_vars_count INTEGER,
+    ds_vars_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS file_vars (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    var INTEGER, desc TEXT, units TEXT, type TEXT, size INTEGER, value_num REAL, value_text TEXT
+);
+CREATE TABLE IF NOT EXISTS ds_vars (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    sweep INTEGER, var INTEGER, desc TEXT, units TEXT, type TEXT, size INTEGER, value_num REAL, value_text TEXT
+);
+CREATE TABLE IF NOT EXISTS channels (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    channel INTEGER, name TEXT, x_units TEXT, y_units TEXT, type INTEGER, kind INTEGER, spacing INTEGER, other INTEGER
+);
+CREATE TABLE IF NOT EXISTS ds_channels (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    channel INTEGER, sweep INTEGER, start INTEGER, points INTEGER,
+    yscale REAL, yoffset REAL, xscale REAL, xoffset REAL
+);
+CREATE INDEX IF NOT EXISTS ds_vars_desc ON ds_vars (desc, value_num);
+CREATE INDEX IF NOT EXISTS file_vars_desc ON file_vars (desc, value_num);
+CREATE INDEX IF NOT EXISTS channels_name ON channels (name);
+CREATE INDEX IF NOT EXISTS ds_vars_file ON ds_vars (file_id);
+CREATE INDEX IF NOT EXISTS file_vars_file ON file_vars (file_id);
+CREATE INDEX IF NOT EXISTS channels_file ON channels (file_id);
+CREATE INDEX IF NOT EXISTS ds_channels_file ON ds_channels (file_id);
+"""
+
+
+def _split_value(value):
+    """Returns (numeric, text) columns for a var value"""
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode(errors='replace')
+    if isinstance(value, str):
+        return None, value
+    try:
+        return float(value), None
+    except (TypeError, ValueError):
+        return None, str(value)
+
+
+def _read_metadata(path):
+    """Reads everything the index stores for a file. Runs in worker threads."""
+    with CFSReader(path, poolSize=1) as reader:
+        return {
+            'cfsid': reader.CFSID,
+            'file_date': reader.fileDate,
+            'file_time': reader.fileTime,
+            'comment': reader.fileComment,
+            'channels': reader.channels,
+            'datasets': reader.datasets,
+            'file_vars_count': reader.fileVarsCount,
+            'ds_vars_count': reader.datasetVarsCount,
+            'fileVars': reader.fileVars,
+            'dsVars': reader.dsVars,
+            'chVars': reader.chVars,
+            'datasetChaVars': reader.datasetChaVars,
+        }
+
+
+class CFSIndex(object):
+    """
+    Metadata index of CFS files stored in a SQLite database.
+    ______
+    Init:
+    dbPath -> Path of the SQLite database, created if it does not exist
+    ______
+    Usage:
+    with CFSIndex('archive.sqlite') as index:
+        index.update('C:\\\\Data')
+        index.find_sweeps('Amplitude', low=50, high=100)
+        index.find_files(channelName='Im')
+    """
+
+    def __init__(self, dbPath):
+        self.dbPath = dbPath
+        self._conn = sqlite3.connect(dbPath)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self._conn.close()
+
+    def update(self, folder, recursive=True, workers=4, prune=True):
+        """
+        Indexes every .cfs file below folder (only directly in folder unless recursive). Files whose mtime and size
+        are unchanged are skipped, and with prune files that were indexed under folder (directly in folder unless
+        recursive) but no longer exist are removed.
+        Returns the number of files (re)indexed.
+        """
+        folder = os.path.abspath(folder)
+        found = {}
+        for root, dirs, files in os.walk(folder):
+            for name in files:
+                if name.lower().endswith('.cfs'):
+                    path = os.path.join(root, name)
+                    st = os.stat(path)
+                    found[path] = (st.st_mtime, st.st_size)
+            if not recursive:
+                break
+
+        known = {path: (mtime, size) for path, mtime, size in self._conn.execute(
+            "SELECT path, mtime, size FROM files WHERE path LIKE ? ESCAPE '\\'", (self._prefix_pattern(folder),))}
+        stale = [path for path, stat in found.items() if known.get(path) != stat]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(path, pool.submit(_read_metadata, path)) for path in stale]
+            for path, future in futures:
+                try:
+                    meta = future.result()
+                except Exception as e:
+                    log.warning(f"Unable to index {path}: {e}")
+                    continue
+                with self._conn:
+                    self._store(path, found[path], meta)
+
+        if prune:
+            with self._conn:
+                for path in set(known) - set(found):
+                    #a non recursive update only walked folder itself, its subfolders were not looked at
+                    if not recursive and os.path.dirname(path) != folder:
+                        continue
+                    self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        log.debug(f"Indexed {len(stale)} of {len(found)} files under {folder}")
+        return len(stale)
+
+    @staticmethod
+    def _prefix_pattern(folder):
+        escaped = os.path.join(folder, '').replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return escaped + '%'
+
+    def _store(self, path, stat, meta):
+        conn = self._conn
+        conn.execute("DELETE FROM files WHERE path = ?", (path,))
+        cur = conn.execute(
+            "INSERT INTO files (path, mtime, size, cfsid, file_date, file_time, comment, channels, datasets, "
+            "file_vars_count, ds_vars_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, stat[0], stat[1], meta['cfsid'], meta['file_date'], meta['file_time'], meta['comment'],
+             meta['channels'], meta['datasets'], meta['file_vars_count'], meta['ds_vars_count']))
+        file_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO file_vars VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            ((file_id, i, v['desc'], v['units'], v['type'], v['size'], *_split_value(v['value']))
+             for i, v in enumerate(meta['fileVars'])))
+        conn.executemany(
+            "INSERT INTO ds_vars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((file_id, sweep, i, v['desc'], v['units'], v['type'], v['size'], *_split_value(v['value']))
+             for sweep, ds in enumerate(meta['dsVars'][:meta['datasets']]) for i, v in enumerate(ds)))
+        conn.executemany(
+            "INSERT INTO channels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((file_id, int(c['Channel']), c['Channel Name'], c['X Units'], c['Y Units'], c['Type'], c['Kind'],
+              c['Spacing'], c['Other']) for c in meta['chVars']))
+        conn.executemany(
+            "INSERT INTO ds_channels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((file_id, int(d['Channel']), sweep, d['ch start'], d['points'], d['yscale'], d['yoffset'], d['xscale'],
+              d['xoffset']) for ch in meta['datasetChaVars'] for sweep, d in enumerate(ch)))
+
+    def query(self, sql, params=()):
+        """Runs a raw SQL query against the index and returns all rows"""
+        return self._conn.execute(sql, params).fetchall()
+
+    def find_sweeps(self, desc, low=None, high=None, value=None):
+        """
+        Returns (path, sweep, value) for every sweep whose DS variable `desc` is within [low, high], or equal to value
+        (numbers or strings). With no bounds every sweep having the variable is returned.
+        """
+        sql = ("SELECT f.path, d.sweep, COALESCE(d.value_num, d.value_text) FROM ds_vars d "
+               "JOIN files f ON f.id = d.file_id WHERE TRIM(d.desc) = ?")
+        #descriptions are fixed width and padded in the file
+        params = [desc.strip()]
+        if value is not None:
+            sql += " AND d.value_text = ?" if isinstance(value, str) else " AND d.value_num = ?"
+            params.append(value)
+        if low is not None:
+            sql += " AND d.value_num >= ?"
+            params.append(low)
+        if high is not None:
+            sql += " AND d.value_num <= ?"
+            params.append(high)
+        return self.query(sql + " ORDER BY f.path, d.sweep", params)
+
+    def find_files(self, channelName=None, fileVar=None, value=None):
+        """
+        Returns the paths of files having a channel named channelName and/or a file variable fileVar
+        (optionally equal to value).
+        """
+        sql = "SELECT DISTINCT f.path FROM files f"
+        where, params = [], []
+        if channelName is not None:
+            sql += " JOIN channels c ON c.file_id = f.id"
+            where.append("TRIM(c.name) = ?")
+            params.append(channelName.strip())
+        if fileVar is not None:
+            sql += " JOIN file_vars v ON v.file_id = f.id"
+            where.append("TRIM(v.desc) = ?")
+            params.append(fileVar.strip())
+            if value is not None:
+                where.append("v.value_text = ?" if isinstance(value, str) else "v.value_num = ?")
+                params.append(value)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return [row[0] for row in self.query(sql + " ORDER BY f.path", params)]
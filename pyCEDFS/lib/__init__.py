@@ -1,5 +1,6 @@
 import os
 import sys
+import threading
 
 
 def is_64bit():
@@ -12,3 +13,29 @@ def get_dllpath():
     else:
         dllname = "CFS32.dll"
     return os.path.join(libpath, dllname)
+
+
+class LazyLibrary(object):
+    """
+    Stand-in for a ctypes library that is only loaded on first attribute access.
+    `loader` is called once (thread-safe) and should return the loaded library or raise.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lib = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._lib is not None
+
+    def _load(self):
+        if self._lib is None:
+            with self._lock:
+                if self._lib is None:
+                    self._lib = self._loader()
+        return self._lib
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
@@ -0,0 +1,143 @@
+"""
+Min/max decimation for fast plotting of long sweeps. Envelopes are computed with a reshape and a reduce over the last
+axis, so a sweep of any length is reduced in a couple of vectorized numpy calls.
+A multi-resolution pyramid of envelopes can be built once per channel and saved next to the file, so zoomed views only
+touch the level they need.
+"""
+import os
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def minmax_decimate(y, binsize):
+    """
+    Reduces y along its last axis into bins of `binsize` points, returning (ymin, ymax).
+    y can be 1D (points) or 2D (sweeps, points). A trailing partial bin is reduced separately and appended.
+    """
+    y = np.asarray(y)
+    binsize = max(int(binsize), 1)
+    n = y.shape[-1]
+    full = (n // binsize) * binsize
+    body = y[..., :full].reshape(y.shape[:-1] + (n // binsize, binsize))
+    ymin = body.min(axis=-1)
+    ymax = body.max(axis=-1)
+    if full < n:
+        tail = y[..., full:]
+        ymin = np.concatenate((ymin, tail.min(axis=-1)[..., None]), axis=-1)
+        ymax = np.concatenate((ymax, tail.max(axis=-1)[..., None]), axis=-1)
+    return ymin, ymax
+
+
+def binsize_for(points, max_points):
+    """Returns the smallest bin size that reduces `points` to at most `max_points` bins"""
+    return max(int(np.ceil(points / max(int(max_points), 1))), 1)
+
+
+def interleave(x, ymin, ymax):
+    """Returns (x, y) with min and max interleaved, ready for a single line plot call"""
+    return np.repeat(x, 2), np.stack((ymin, ymax), axis=-1).reshape(ymin.shape[:-1] + (-1,))
+
+
+class OverviewPyramid(object):
+    """
+    Multi-resolution min/max envelopes of a single trace. Level 0 has bins of `base` points, each following level is
+    `factor` times coarser and is reduced from the previous level rather than the raw data.
+    ______
+    Build with OverviewPyramid.build(y), query with .view(i0, i1, max_points).
+    """
+
+    def __init__(self, points, binsizes, mins, maxs):
+        self.points = int(points)
+        self.binsizes = [int(b) for b in binsizes]
+        self.mins = list(mins)
+        self.maxs = list(maxs)
+
+    @classmethod
+    def build(cls, y, base=16, factor=4, min_bins=256):
+        """Builds the pyramid of y, stopping once a level has fewer than `min_bins` bins"""
+        y = np.asarray(y)
+        binsizes, mins, maxs = [], [], []
+        ymin, ymax = minmax_decimate(y, base)
+        binsize = base
+        while True:
+            binsizes.append(binsize)
+            mins.append(ymin)
+            maxs.append(ymax)
+            if ymin.shape[-1] <= min_bins:
+                break
+            ymin, _ = minmax_decimate(ymin, factor)
+            _, ymax = minmax_decimate(ymax, factor)
+            binsize *= factor
+        return cls(y.shape[-1], binsizes, mins, maxs)
+
+    def level_for(self, points, max_points):
+        """Returns the index of the finest level showing `points` samples in at most `max_points` bins, or -1 if the
+        raw data already fits. If no level fits this is the coarsest one, which view folds further."""
+        if points <= max_points:
+            return -1
+        for level, binsize in enumerate(self.binsizes):
+            if np.ceil(points / binsize) <= max_points:
+                return level
+        return len(self.binsizes) - 1
+
+    def view(self, i0=0, i1=None, max_points=2000):
+        """
+        Returns (bin start indices, ymin, ymax) with at most max_points bins covering samples [i0, i1) from the best
+        level, or None if the raw samples already fit in max_points and should be used directly.
+        """
+        i1 = self.points if i1 is None else min(int(i1), self.points)
+        i0 = max(int(i0), 0)
+        level = self.level_for(i1 - i0, max_points)
+        if level < 0:
+            return None
+        binsize = self.binsizes[level]
+        b0 = i0 // binsize
+        b1 = -(-i1 // binsize)
+        starts, ymin, ymax = np.arange(b0, b1) * binsize, self.mins[level][..., b0:b1], self.maxs[level][..., b0:b1]
+        fold = binsize_for(b1 - b0, max_points)
+        if fold > 1:
+            #even the coarsest level has too many bins, fold its envelopes down to max_points
+            ymin, _ = minmax_decimate(ymin, fold)
+            _, ymax = minmax_decimate(ymax, fold)
+            starts = starts[::fold]
+        return starts, ymin, ymax
+
+    def to_arrays(self, prefix=''):
+        """Flattens the pyramid into a dict of arrays for np.savez"""
+        out = {f'{prefix}points': np.asarray(self.points), f'{prefix}binsizes': np.asarray(self.binsizes)}
+        for level in range(len(self.binsizes)):
+            out[f'{prefix}min{level}'] = self.mins[level]
+            out[f'{prefix}max{level}'] = self.maxs[level]
+        return out
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix=''):
+        binsizes = arrays[f'{prefix}binsizes']
+        mins = [arrays[f'{prefix}min{level}'] for level in range(len(binsizes))]
+        maxs = [arrays[f'{prefix}max{level}'] for level in range(len(binsizes))]
+        return cls(arrays[f'{prefix}points'], binsizes, mins, maxs)
+
+
+def _npz_path(path):
+    """Returns path with the .npz suffix np.savez adds to paths without it"""
+    path = os.fspath(path)
+    return path if path.endswith('.npz') else path + '.npz'
+
+
+def save_pyramids(path, pyramids):
+    """Saves a {sweep: OverviewPyramid} dict to a single .npz file (.npz is appended if path lacks it), returns the
+    path written"""
+    path = _npz_path(path)
+    arrays = {'sweeps': np.asarray(sorted(pyramids), dtype=np.int64)}
+    for sweep, pyramid in pyramids.items():
+        arrays.update(pyramid.to_arrays(prefix=f's{sweep}_'))
+    np.savez(path, **arrays)
+    return path
+
+
+def load_pyramids(path):
+    """Loads a {sweep: OverviewPyramid} dict written by save_pyramids, from the same path given to it"""
+    with np.load(_npz_path(path)) as arrays:
+        return {int(sweep): OverviewPyramid.from_arrays(arrays, prefix=f's{sweep}_') for sweep in arrays['sweeps']}
@@ -0,0 +1,192 @@
+"""
+Parallel decoding of a single CFS file. The (channel, sweep) reads are split across a pool of worker processes (or
+threads), each with its own DLL handle. Worker processes write into per channel multiprocessing.shared_memory blocks,
+threads write straight into the final arrays.
+"""
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import pyCEDFS as _cfs
+from . import handles
+
+log = logging.getLogger(__name__)
+
+
+class _BlockOwner(object):
+    """
+    Holds an (unlinked) shared memory block for the arrays viewing it. numpy keeps the owner as the base of every view,
+    so the block stays mapped as long as any of them is alive and is closed with the last one.
+    """
+
+    def __init__(self, shm, shape, dtype):
+        self._shm = shm
+        self._arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.__array_interface__ = self._arr.__array_interface__
+
+    def __del__(self):
+        #the array is an export of the block's buffer, it has to go before the block can be closed
+        self._arr = None
+        self._shm.close()
+
+
+def _attach(spec):
+    """Returns (SharedMemory, ndarray) for a (name, shape, dtype) spec"""
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _decoded_dtypes(chVars, datasetChaVars, ch):
+    """Returns the (x, y) dtypes _decode_chan gives a channel, so the parallel arrays match the serial decode"""
+    def scaled(other):
+        if not datasetChaVars[other]:
+            return np.dtype(np.float64)
+        sample = np.zeros(1, dtype=_cfs.chanDataTypes[chVars[other]['Type']])
+        return _cfs._scale_chan_data(sample, datasetChaVars[other][0]).dtype
+    other = chVars[ch]['Other']
+    if (chVars[ch]['Kind'] == _cfs.MATRIX and 0 <= other < len(chVars) and other != ch
+            and chVars[other]['Kind'] == _cfs.SUBSIDIARY):
+        x = scaled(other)
+    else:
+        x = np.dtype(np.float64)
+    return x, scaled(ch)
+
+
+def _array_specs(chVars, datasetChaVars):
+    """Returns {channel: ((shape, x dtype), (shape, y dtype))} of the padded (sweeps, points) arrays of each channel"""
+    datasets = len(datasetChaVars[0]) if chVars else 0
+    specs = {}
+    for ch in range(len(chVars)):
+        points = max([d['points'] for d in datasetChaVars[ch]] + [0])
+        specs[ch] = tuple(((datasets, points), dtype) for dtype in _decoded_dtypes(chVars, datasetChaVars, ch))
+    return specs
+
+
+def _decode_jobs(cfsFilePath, jobs, chVars, datasetChaVars, specs=None, arrays=None):
+    """
+    Worker: decodes the (channel, sweep) jobs into the shared blocks named in specs, or straight into arrays
+    ({channel: (x array, y array)}) when it runs in the process that owns them. Returns [(channel, sweep, points)]
+    """
+    shms = []
+    attached = arrays is None
+    arrays = {} if attached else arrays
+    lengths = []
+    try:
+        with handles.opened(cfsFilePath) as handle:
+            for ch, sweep in jobs:
+                if ch not in arrays:
+                    (shm_x, arr_x), (shm_y, arr_y) = _attach(specs[ch][0]), _attach(specs[ch][1])
+                    shms.extend((shm_x, shm_y))
+                    arrays[ch] = (arr_x, arr_y)
+                    del arr_x, arr_y
+                x, y = _cfs._decode_chan(handle, chVars, datasetChaVars, ch, sweep)
+                arrays[ch][0][sweep, :x.shape[0]] = x
+                arrays[ch][1][sweep, :y.shape[0]] = y
+                lengths.append((ch, sweep, y.shape[0]))
+    finally:
+        if attached:
+            #the array views have to go before the blocks can be closed
+            arrays.clear()
+            for shm in shms:
+                shm.close()
+    return lengths
+
+
+def _run_jobs(cfsFilePath, chVars, datasetChaVars, workers, useProcesses, specs=None, arrays=None):
+    """Splits the decode over the workers and returns a (channels, sweeps) array of decoded points"""
+    channels = len(chVars)
+    datasets = len(datasetChaVars[0]) if channels else 0
+    #interleave the jobs so every worker gets a mix of channels and sweeps
+    jobs = [(ch, sweep) for sweep in range(datasets) for ch in range(channels)]
+    workers = max(min(int(workers or 1), len(jobs)), 1)
+    lengths = np.zeros((channels, datasets), dtype=np.int64)
+    if workers == 1:
+        results = [_decode_jobs(cfsFilePath, jobs, chVars, datasetChaVars, specs, arrays)]
+    else:
+        chunks = [jobs[i::workers] for i in range(workers)]
+        Executor = ProcessPoolExecutor if useProcesses else ThreadPoolExecutor
+        with Executor(max_workers=workers) as pool:
+            futures = [pool.submit(_decode_jobs, cfsFilePath, chunk, chVars, datasetChaVars, specs, arrays)
+                       for chunk in chunks]
+            results = [future.result() for future in futures]
+    for result in results:
+        for ch, sweep, points in result:
+            lengths[ch, sweep] = points
+    return lengths
+
+
+def decode_to_blocks(cfsFilePath, chVars, datasetChaVars, workers=4, useProcesses=True):
+    """
+    Decodes every channel and sweep of a CFS file into new shared memory blocks, one padded (sweeps, points) block
+    each for x and y per channel, in the dtypes the serial decode returns. With workers <= 1 the decode runs in the
+    calling thread.
+    Returns (blocks, specs, lengths): the SharedMemory objects (the caller must close and unlink them),
+    {channel: (x spec, y spec)} with (name, shape, dtype) specs, and a (channels, sweeps) array of decoded points.
+    """
+    blocks = []
+    specs = {}
+    try:
+        for ch, chSpecs in _array_specs(chVars, datasetChaVars).items():
+            named = []
+            for shape, dtype in chSpecs:
+                shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+                blocks.append(shm)
+                named.append((shm.name, shape, dtype))
+            specs[ch] = tuple(named)
+        lengths = _run_jobs(cfsFilePath, chVars, datasetChaVars, workers, useProcesses, specs=specs)
+        return blocks, specs, lengths
+    except BaseException:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+        raise
+
+
+def views_from_blocks(arrays, lengths):
+    """
+    Returns (dataX, dataY) in the CFS._read_data layout as views into per channel (x array, y array) pairs:
+    a (sweeps, points) view per channel, or a list of per sweep row views if the sweeps differ in length.
+    """
+    dataX, dataY = [], []
+    for ch, (arr_x, arr_y) in enumerate(arrays):
+        if lengths.shape[1] and np.all(lengths[ch] == lengths[ch, 0]):
+            n = lengths[ch, 0]
+            dataX.append(arr_x[:, :n])
+            dataY.append(arr_y[:, :n])
+        else:
+            dataX.append([arr_x[sweep, :n] for sweep, n in enumerate(lengths[ch])])
+            dataY.append([arr_y[sweep, :n] for sweep, n in enumerate(lengths[ch])])
+    return dataX, dataY
+
+
+def decode_file(cfsFilePath, chVars, datasetChaVars, workers=4, useProcesses=True):
+    """
+    Decodes every channel and sweep of a CFS file using `workers` processes (or threads if useProcesses is False).
+    Returns (dataX, dataY) in the same layout and dtypes as CFS._read_data: per channel a (sweeps, points) array, or a
+    list of per sweep arrays if the sweeps of that channel differ in length.
+    Threads decode straight into the returned arrays. Processes decode into shared memory blocks that are unlinked
+    right away and then back the returned arrays themselves, each block is closed when the last view of it is gone.
+    """
+    if not useProcesses or workers is None or workers <= 1:
+        arrays = {ch: tuple(np.empty(shape, dtype=dtype) for shape, dtype in chSpecs)
+                  for ch, chSpecs in _array_specs(chVars, datasetChaVars).items()}
+        lengths = _run_jobs(cfsFilePath, chVars, datasetChaVars, workers, useProcesses, arrays=arrays)
+        return views_from_blocks([arrays[ch] for ch in range(len(chVars))], lengths)
+
+    blocks, specs, lengths = decode_to_blocks(cfsFilePath, chVars, datasetChaVars, workers=workers,
+                                              useProcesses=useProcesses)
+    byName = {shm.name: shm for shm in blocks}
+    arrays = []
+    try:
+        for ch in range(len(chVars)):
+            arrays.append(tuple(np.asarray(_BlockOwner(byName.pop(name), shape, dtype)) for name, shape, dtype in specs[ch]))
+    finally:
+        #blocks not handed to an owner yet (after an error) are closed here, the owners close theirs
+        for shm in byName.values():
+            shm.close()
+        for shm in blocks:
+            shm.unlink()
+    return views_from_blocks(arrays, lengths)
@@ -8,27 +8,42 @@ import numpy as np
 from pathlib import PureWindowsPath
 import hashlib
 import ctypes
-import matplotlib.pyplot as plt
-import pkg_resources
 import uuid
+import logging
+from . import overview
+from . import tables
+from . import resample
+from . import handles
+from .records import VarRecord, ChannelRecord, DSChannelRecord
 
-# Load the shared library into c types. 
-from .lib import get_dllpath, is_64bit
-try:
-    CFS64 = ctypes.CDLL(get_dllpath())
-except FileNotFoundError:
-    arch = "64-bit" if is_64bit() else "32-bit"
-    e = (
-        "Unable to load the CFS library. This probably means you need to "
-        "install the Visual C++ 2010 Runtime library for your system ({0}). "
-        "If this error persists, please file a bug report!"
-    )
-    raise RuntimeError(e.format(arch)) from None
+# The shared library is loaded into c types on first use, so importing pyCEDFS stays cheap and does not fail
+# on systems without the CFS library until it is actually needed.
+from .lib import get_dllpath, is_64bit, LazyLibrary
 
-import logging
-logging.basicConfig(level=logging.WARN)
 log = logging.getLogger(__name__)
 
+
+def _load_library():
+    try:
+        lib = ctypes.CDLL(get_dllpath())
+    except (FileNotFoundError, OSError):
+        arch = "64-bit" if is_64bit() else "32-bit"
+        e = (
+            "Unable to load the CFS library. This probably means you need to "
+            "install the Visual C++ 2010 Runtime library for your system ({0}). "
+            "If this error persists, please file a bug report!"
+        )
+        raise RuntimeError(e.format(arch)) from None
+    #Declared once here, the buffer is passed as a void pointer so concurrent reads of different dtypes don't race on argtypes
+    lib.GetChanData.argtypes = (ctypes.c_short,ctypes.c_short,ctypes.c_int,ctypes.c_ulonglong,ctypes.c_int, ctypes.c_void_p, ctypes.c_ulonglong)
+    #handles and error codes are shorts, see pyCEDFS.handles
+    lib.OpenCFSFile.restype = ctypes.c_short
+    lib.CloseCFSFile.restype = ctypes.c_short
+    return lib
+
+
+CFS64 = LazyLibrary(_load_library)
+
 dataVarTypes = [('INT1', ctypes.c_int), 
 ('WRD1', ctypes.c_ushort),
 ('INT2', ctypes.c_int16),
@@ -46,6 +61,332 @@ dataVarTypes = [('INT1', ctypes.c_int),
 #define RL8     6
 #define LSTR    7
 
+#Native element types of channel data, indexed by the chVars 'Type'. These have to match the on disk size of each
+#element, as GetChanData fills the buffer element by element
+chanDataTypes = [ctypes.c_int8, ctypes.c_uint8, ctypes.c_int16, ctypes.c_uint16, ctypes.c_int32, ctypes.c_float, ctypes.c_double]
+
+#Channel kinds, chVars 'Kind'
+EQUALSPACED = 0 #y values only, x is xoffset + index * xscale
+MATRIX = 1 #y values, x values are held by the SUBSIDIARY channel named in 'Other'
+SUBSIDIARY = 2 #values belonging to a MATRIX channel
+
+
+def _open_handle(cfsFilePath):
+    """Opens a CFS file read-only and returns the DLL handle, raises handles.CFSError on failure
+    """
+    return handles.open_handle(cfsFilePath)
+
+
+def _get_gen_info(handle):
+    """Returns the (date, time, comment) strings of an open CFS file handle
+    """
+    _filedate = ctypes.create_string_buffer(10)  
+    _filetime = ctypes.create_string_buffer(10)  
+    _comment = ctypes.create_string_buffer(256)
+    CFS64.GetGenInfo(handle, _filedate, _filetime, _comment)
+    return _filedate.value.decode(), _filetime.value.decode(), _comment.value.decode()
+
+
+def _get_file_info(handle):
+    """Returns the (channels, dataset vars, file vars, datasets) counts of an open CFS file handle
+    """
+    _channels = ctypes.c_short(14)
+    _dsvars = ctypes.c_short(14)
+    _fvars = ctypes.c_short(14)
+    _ds = ctypes.c_ushort(14)
+    CFS64.GetFileInfo(handle, ctypes.byref(_channels),ctypes.byref(_dsvars), ctypes.byref(_fvars), ctypes.byref(_ds))
+    return _channels.value, _dsvars.value, _fvars.value, _ds.value
+
+
+def _get_file_vars(handle, fileVarsCount):
+    """Returns the file vars (one VarRecord per variable) of an open CFS file handle
+    """
+    reader = _VarReader(handle, 0)
+    return [VarRecord(desc, size, units, dataVarTypes[varType][0], reader.read(x, varType, size))
+            for x, desc, size, varType, units in _get_var_descs(handle, fileVarsCount, 0)]
+
+
+def _get_var_descs(handle, count, varKind):
+    """Returns [(var no, desc, size, type, units)] of the file (varKind 0) or DS (varKind 1) variables
+    """
+    descs = []
+    _size = ctypes.c_short()
+    _type = ctypes.c_short()
+    _units = ctypes.create_string_buffer(20)  
+    _desc = ctypes.create_string_buffer(50) 
+    for x in range(count):
+        CFS64.GetVarDesc(handle, ctypes.c_short(x), ctypes.c_short(varKind), ctypes.byref(_size), ctypes.byref(_type), _units, _desc)
+        descs.append((x, _desc.value.decode(), _size.value, _type.value, _units.value.decode()))
+    return descs
+
+
+class _VarReader(object):
+    """Reads variable values with one reusable ctypes buffer per variable type instead of one per value"""
+
+    def __init__(self, handle, varKind):
+        self.handle = handle
+        self.varKind = ctypes.c_short(varKind)
+        self._buffers = {}
+
+    def read(self, var, varType, size, ds=0):
+        _datas = ctypes.c_ushort(ds)
+        if varType != 7:
+            #chanDataTypes holds the on disk size of each numeric type
+            _var = self._buffers.get(varType)
+            if _var is None:
+                _var = self._buffers[varType] = chanDataTypes[varType]()
+            CFS64.GetVarVal(self.handle, ctypes.c_short(var), self.varKind, ctypes.byref(_datas), ctypes.byref(_var))
+            return _var.value
+        _var = self._buffers.get((varType, size))
+        if _var is None:
+            _var = self._buffers[(varType, size)] = ctypes.create_string_buffer(size + 1)
+        CFS64.GetVarVal(self.handle, ctypes.c_short(var), self.varKind, ctypes.byref(_datas), _var)
+        return _var.value.decode()
+
+
+def _get_ds_vars(handle, datasetVarsCount, datasetList, names=None):
+    """Returns the DS vars (a list of VarRecords, per dataset) of an open CFS file handle.
+    Variable descriptions are read once, if names is given only the variables with those descriptions are read.
+    """
+    descs = _get_var_descs(handle, datasetVarsCount, 1)
+    if names is not None:
+        descs = _select_var_descs(descs, names)
+    reader = _VarReader(handle, 1)
+    ds_vars = []
+    for d in datasetList:
+        ds_vars.append([VarRecord(desc, size, units, dataVarTypes[varType][0], reader.read(x, varType, size, int(d)))
+                        for x, desc, size, varType, units in descs])
+    return ds_vars
+
+
+def _select_var_descs(descs, names):
+    byName = {item[1].strip(): item for item in descs}
+    missing = [name for name in names if name.strip() not in byName]
+    if missing:
+        raise KeyError(f"DS variables not found: {missing}. Available: {list(byName)}")
+    return [byName[name.strip()] for name in names]
+
+
+def read_ds_vars(cfsFilePath, names, sweeps=None):
+    """
+    Reads only the named DS variables of a CFS file, for all (or the given) sweeps, without building the rest of the
+    metadata or reading any data. Returns {name: numpy column}, numeric variables get their native dtype.
+    """
+    with handles.opened(cfsFilePath) as handle:
+        _, dsVarsCount, _, datasets = _get_file_info(handle)
+        descs = _select_var_descs(_get_var_descs(handle, dsVarsCount, 1), names)
+        if sweeps is None:
+            sweeps = range(datasets)
+        reader = _VarReader(handle, 1)
+        columns = {}
+        for name, (x, desc, size, varType, units) in zip(names, descs):
+            values = [reader.read(x, varType, size, sweep + 1) for sweep in sweeps]
+            if varType == 7:
+                columns[name] = np.array(values, dtype=object)
+            else:
+                columns[name] = np.array(values, dtype=np.dtype(chanDataTypes[varType]))
+        return columns
+
+
+def _get_ch_vars(handle, channels):
+    """Returns the channel vars (one ChannelRecord per channel) of an open CFS file handle
+    """
+    ch_vars = []
+    _channame = ctypes.create_string_buffer(21) 
+    _xunits = ctypes.create_string_buffer(20) 
+    _yunits = ctypes.create_string_buffer(20)
+    _kind = ctypes.c_short()
+    _type = ctypes.c_short()
+    _spacing = ctypes.c_short()
+    _other = ctypes.c_short()
+    for ch in np.arange(channels):
+        _ch = ctypes.c_short(ch)
+        CFS64.GetFileChan(handle, _ch, _channame, _yunits, _xunits, ctypes.byref(_type), ctypes.byref(_kind), ctypes.byref(_spacing), ctypes.byref(_other))
+        ch_vars.append(ChannelRecord(int(ch), _channame.value.decode(), _xunits.value.decode(), _yunits.value.decode(), _type.value, _kind.value, _spacing.value, _other.value))
+    return ch_vars
+
+
+def _get_dsch_vars(handle, channels, datasets):
+    """Returns the dataset channel vars (a list of DSChannelRecords, per channel) of an open CFS file handle
+    """
+    dsch_vars = []
+    _start = ctypes.c_long()
+    _points = ctypes.c_long()
+    _yscale = ctypes.c_float()
+    _yoffset = ctypes.c_float()
+    _xscale = ctypes.c_float()
+    _xoffset = ctypes.c_float()
+    for ch in np.arange(channels):
+        ds_dict = []
+        for x in np.arange(1,datasets+1):
+            CFS64.GetDSChan(handle, 
+                           ctypes.c_short(ch), ##Channel
+                           ctypes.c_ushort(x),
+                           ctypes.byref(_start),
+                           ctypes.byref(_points),
+                           ctypes.byref(_yscale),
+                           ctypes.byref(_yoffset),
+                           ctypes.byref(_xscale),
+                           ctypes.byref(_xoffset),
+                             )
+            ds_dict.append(DSChannelRecord(int(ch), _start.value, _points.value, _yscale.value, _yoffset.value, _xscale.value, _xoffset.value))
+        dsch_vars.append(ds_dict)
+    return dsch_vars
+
+
+def _check_chan_read(read, pointsRead, points, ch, ds):
+    """Raises a CFSError if a GetChanData call failed: an error code, or no data before all `points` were read
+    """
+    handles.check(read, f"read channel {ch} of dataset {ds}")
+    if read == 0:
+        raise handles.CFSError(-13, f"Unable to read channel {ch} of dataset {ds}: "
+                                    f"no data after {pointsRead} of {points} points")
+
+
+def _get_chan_data(handle, ch, ds, dtype, points, first=0, step_size=10000):
+    """Reads `points` raw (unscaled) elements starting at element `first` of channel `ch` in dataset `ds` (1-indexed).
+    Reads are done in blocks of `step_size` elements into a single preallocated array.
+    Returns the numpy array and the number of points read. Raises CFSError if the DLL fails or returns fewer points.
+    """
+    chanData = CFS64.GetChanData
+    points = int(points)
+    _dataarray = (dtype * max(points, 1))()
+    pointsRead = 0
+    while pointsRead < points:
+        count = min(step_size, points - pointsRead)
+        #Point the DLL at the right place in the preallocated array
+        _block = (dtype * count).from_buffer(_dataarray, pointsRead * ctypes.sizeof(dtype))
+        read = chanData(handle, ch, ds, first + pointsRead, count, _block, ctypes.sizeof(_block))
+        _check_chan_read(read, pointsRead, points, ch, ds)
+        pointsRead += read
+    data = np.ctypeslib.as_array(_dataarray)[:pointsRead]
+    return data, pointsRead
+
+
+def _iter_chan_data(handle, ch, ds, dtype, points, first=0, step_size=10000):
+    """Yields the raw elements of channel `ch` in dataset `ds` (1-indexed) in blocks of up to `step_size`.
+    The same buffer is reused for every block, so each yielded array is only valid until the next one is read.
+    Raises CFSError if the DLL fails or the data ends before `points`, rather than ending early.
+    """
+    chanData = CFS64.GetChanData
+    _dataarray = (dtype * max(min(int(points), step_size), 1))()
+    data = np.ctypeslib.as_array(_dataarray)
+    pointsRead = 0
+    while pointsRead < points:
+        count = min(step_size, int(points) - pointsRead)
+        read = chanData(handle, ch, ds, first + pointsRead, count, _dataarray, ctypes.sizeof(dtype) * count)
+        _check_chan_read(read, pointsRead, points, ch, ds)
+        pointsRead += read
+        yield data[:read]
+
+
+def _new_hash(algorithm):
+    if algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(algorithm)
+
+
+def file_datetime(cfsFilePath):
+    """Returns the recording datetime of a CFS file, taken from its last modification time (to the second)
+    """
+    str_time = "%a %b %d %H:%M:%S %Y"
+    last_mod = time.ctime(int(os.path.getmtime(cfsFilePath)))
+    return datetime.datetime.strptime(last_mod, str_time)
+
+
+def file_identity(cfsFilePath, algorithm='blake2b', chunkSize=1 << 20):
+    """
+    Returns a hex content hash of a CFS file, streamed over the raw header and data section bytes without decoding
+    any samples. Identical files always give the same identity, regardless of path or load.
+    """
+    h = _new_hash(algorithm)
+    buffer = bytearray(chunkSize)
+    view = memoryview(buffer)
+    with open(cfsFilePath, 'rb') as fh:
+        while True:
+            read = fh.readinto(buffer)
+            if not read:
+                break
+            h.update(view[:read])
+    return h.hexdigest()
+
+
+def sample_rates(datasetChaVars):
+    """
+    Returns the sampling rate (1 / xscale, in samples per X unit) of every channel and dataset as a
+    (channels, datasets) array, computed from the header only. Channels with no time base (xscale == 0) get NaN.
+    """
+    xscale = np.array([[d['xscale'] for d in ch] for ch in datasetChaVars], dtype=np.float64)
+    xscale = xscale.reshape(len(datasetChaVars), -1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(xscale != 0, 1.0 / xscale, np.nan)
+
+
+#Relative tolerance when converting times to sample indices. xscale is stored as a float (relative precision ~6e-8),
+#so e.g. 1e-4 is read as 9.9999997e-05 and a time on a sample lands up to ~6e-8 * index samples past it
+_INDEX_TOLERANCE = 2e-7
+
+
+def _ceil_index(position):
+    """Returns the first sample index at or after a fractional sample position, snapping positions within
+    _INDEX_TOLERANCE (relative, at least 1e-6 samples) of a sample onto it"""
+    nearest = np.round(position)
+    if abs(position - nearest) <= max(1e-6, _INDEX_TOLERANCE * abs(position)):
+        return int(nearest)
+    return int(np.ceil(position))
+
+
+def window_to_range(dsch_vars, t0=None, t1=None):
+    """
+    Converts the time window [t0, t1) (X units) of an equally spaced channel in one dataset to the sample range
+    (first, count) using its xoffset and xscale. None means the start or end of the sweep.
+    """
+    points = dsch_vars['points']
+    xoffset, xscale = dsch_vars['xoffset'], dsch_vars['xscale']
+    first = 0 if t0 is None or not xscale else _ceil_index((t0 - xoffset) / xscale)
+    last = points if t1 is None or not xscale else _ceil_index((t1 - xoffset) / xscale)
+    first = min(max(first, 0), points)
+    last = min(max(last, first), points)
+    return first, last - first
+
+
+def read_window(cfsFilePath, channel, sweep, t0=None, t1=None, raw=False):
+    """
+    Reads only the samples of a sweep within the time window [t0, t1) from a CFS file, without loading the file.
+    Returns (x, y). For many windows from the same file use a CFSReader and its read_window instead.
+    """
+    from .reader import CFSReader
+    with CFSReader(cfsFilePath, poolSize=1) as reader:
+        return reader.read_window(channel, sweep, t0, t1, raw=raw)
+
+
+def _scale_chan_data(data, dsch_vars):
+    """Applies the dataset channel scale and offset to raw data
+    """
+    return data * dsch_vars['yscale'] + dsch_vars['yoffset']
+
+
+def _decode_chan(handle, chVars, datasetChaVars, ch, sweep, first=0, count=None, raw=False):
+    """
+    Reads and decodes `count` points (default: to the end) from element `first` of a channel in a sweep (0-indexed).
+    Returns (x, y). y is scaled to channel units unless raw is True. x depends on the channel kind:
+    EQUALSPACED and SUBSIDIARY channels get xoffset + index * xscale, MATRIX channels take their (scaled) x values
+    from the SUBSIDIARY channel named in 'Other', falling back to equal spacing if there is none.
+    """
+    ch_vars = chVars[ch]
+    dsch = datasetChaVars[ch][sweep]
+    if count is None:
+        count = max(dsch['points'] - first, 0)
+    data, pointsRead = _get_chan_data(handle, ch, sweep + 1, chanDataTypes[ch_vars['Type']], count, first)
+    y = data if raw else _scale_chan_data(data, dsch)
+    other = ch_vars['Other']
+    if ch_vars['Kind'] == MATRIX and 0 <= other < len(chVars) and other != ch and chVars[other]['Kind'] == SUBSIDIARY:
+        x_raw, _ = _get_chan_data(handle, other, sweep + 1, chanDataTypes[chVars[other]['Type']], pointsRead, first)
+        x = _scale_chan_data(x_raw, datasetChaVars[other][sweep])
+    else:
+        x = dsch['xoffset'] + (np.arange(pointsRead) + first) * dsch['xscale']
+    return x, y
+
 class CFS(object):
     """
     CFS File object. Represents a CFS File containing both sweep information and metadata (if availible).
@@ -54,13 +395,18 @@ class CFS(object):
     cfsFilePath -> A str or os.path object pointing towards a CFS (.cfs) file  
     stimChannels -> User defined stimulus channels as a list or python array  
     respChannels -> User defined response channels as a list or python array  
+    workers -> Decode the channels and sweeps on a pool of this many workers, each with its own file handle  
+    useProcesses -> Use worker processes (default) or threads for the pool  
+    ds_vars -> Only read these DS variables (by description) into dsVars, default all  
+    handlePool -> Borrow the file handle from this handles.HandlePool instead of opening and closing one  
+    load_data -> If False only the metadata is read, dataX and dataY are None and data has to be read from the file (e.g. with CFSReader)  
     ______
     Return:
     CFS (obj) -> A python object with the CFS data as attributes. Sweep data can be accessed by CFS.dataX, CFS.dataY, CFS.dataC
 
     """
 
-    def __init__(self, cfsFilePath, stimChannels=None, respChannels=None, stimRespPairs=None):
+    def __init__(self, cfsFilePath, stimChannels=None, respChannels=None, stimRespPairs=None, workers=None, useProcesses=True, ds_vars=None, handlePool=None, load_data=True):
 
         self.cfsFilePath = os.path.abspath(cfsFilePath)
         self.cfsFolderPath = os.path.dirname(self.cfsFilePath)
@@ -70,46 +416,43 @@ class CFS(object):
             raise ValueError("CFS file does not exist: %s" % self.cfsFilePath)
         self.CFSID = os.path.splitext(os.path.basename(self.cfsFilePath))[0]
         
-        ##Open the file and pass the handle ##
-        open = CFS64.OpenCFSFile
-        open.restype = ctypes.c_short
-        C_file = ctypes.create_string_buffer(self.cfsFilePath.encode())
-        handle = open(C_file, 0, 0)
-        self._fileHandle = handle
-        log.debug(f"Loaded file: {self.CFSID} with handle: {self._fileHandle}")
-        ## Load the File properties and pass them to class ##
-        _filedate = ctypes.create_string_buffer(10)  
-        _filetime = ctypes.create_string_buffer(10)  
-        _comment = ctypes.create_string_buffer(256)
-        CFS64.GetGenInfo(self._fileHandle, _filedate, _filetime, _comment)
-        self.fileDate = _filedate.value.decode()
-        self.fileTime = _filetime.value.decode()
-        self.fileComment = _comment.value.decode()   
-        _channels = ctypes.c_short(14)
-        _dsvars = ctypes.c_short(14)
-        _fvars = ctypes.c_short(14)
-        _ds = ctypes.c_ushort(14)
-        resp = CFS64.GetFileInfo(self._fileHandle, ctypes.byref(_channels),ctypes.byref(_dsvars), ctypes.byref(_fvars), ctypes.byref(_ds))
-        
-        self.channels = _channels.value
-        self.channelList = np.arange(0, _channels.value)
-        self.datasetVarsCount = _dsvars.value
-        self.fileVarsCount = _fvars.value
-        self.datasets = _ds.value
-        self.datasetList = np.arange(1, _ds.value+2) ##Datasets start at 1?
-        ## Load the vars from each functions ##
-        self.fileVars = self._build_file_vars()
-        self.dsVars = self._build_ds_vars()
-        self.chVars = self._build_ch_vars()
-        self.datasetChaVars = self._build_dsch_vars()
-        self.sweeps = self.datasets ##Number of ds == num sweeps?
-        self.sweepList = np.arange(0,_ds.value)
-        
-
-        ## Try to read sweep data ##
-        self.dataX, self.dataY = self._read_data()
-        #close the file?
-        CFS64.CloseCFSFile(self._fileHandle)
+        ##Open the file and pass the handle, it is closed (or returned to the pool) even if reading fails ##
+        opener = handles.opened(self.cfsFilePath) if handlePool is None else handlePool.acquire(self.cfsFilePath)
+        with opener as handle:
+            self._fileHandle = handle
+            log.debug(f"Loaded file: {self.CFSID} with handle: {self._fileHandle}")
+            ## Load the File properties and pass them to class ##
+            self.fileDate, self.fileTime, self.fileComment = _get_gen_info(self._fileHandle)
+            _channels, _dsvars, _fvars, _ds = _get_file_info(self._fileHandle)
+
+            self.channels = _channels
+            self.channelList = np.arange(0, _channels)
+            self.datasetVarsCount = _dsvars
+            self.fileVarsCount = _fvars
+            self.datasets = _ds
+            self.datasetList = np.arange(1, _ds+2) ##Datasets start at 1?
+            ## Load the vars from each functions ##
+            self.fileVars = self._build_file_vars()
+            self.dsVars = self._build_ds_vars(names=ds_vars)
+            self.chVars = self._build_ch_vars()
+            self.datasetChaVars = self._build_dsch_vars()
+            self.sweeps = self.datasets ##Number of ds == num sweeps?
+            self.sweepList = np.arange(0,_ds)
+            self._sweepViews = {}
+            self._overviews = {}
+            self._digests = {}
+            self._fileGUID = None
+
+
+            ## Try to read sweep data ##
+            if not load_data:
+                self.dataX, self.dataY = None, None
+            elif workers is not None and workers > 1:
+                from . import parallel #multiprocessing is only imported for a parallel decode
+                self.dataX, self.dataY = parallel.decode_file(self.cfsFilePath, self.chVars, self.datasetChaVars,
+                                                              workers=workers, useProcesses=useProcesses)
+            else:
+                self.dataX, self.dataY = self._read_data()
 
         #try to figure out what channels to use for pyabf like indexing
         if stimChannels is None and respChannels is None:
@@ -134,7 +477,8 @@ class CFS(object):
         #Initilize pyABF-like attributes
         try:
             self._populate_attributes()
-            self.setSweep(0)
+            if self.dataY is not None:
+                self.setSweep(0)
         except:
             log.warning("pyABF-like attributes failed to intialize")
 
@@ -142,133 +486,30 @@ class CFS(object):
 
     def _build_file_vars(self):
         ### Populate the Vars list
-        files_vars = []
-        #Create our ctypes to avoid memory hog
-        _size = ctypes.c_short()
-        _type = ctypes.c_short()
-        _units = ctypes.create_string_buffer(20)  
-        _desc = ctypes.create_string_buffer(50) 
-        ###Populate file Vars
-        for x in np.arange(self.fileVarsCount):
-            CFS64.GetVarDesc(self._fileHandle, ##File self._fileHandle
-                            ctypes.c_short(x), ##Var no
-                            ctypes.c_short(0), ##File var = 0
-                            ctypes.byref(_size), ctypes.byref(_type), _units, _desc)
-            if _type.value != 7:
-                _var = dataVarTypes[_type.value][1](99)
-                _datas = ctypes.c_short()
-                code = CFS64.GetVarVal(self._fileHandle,##Handle
-                                     ctypes.c_short(x), ##Var no
-                                    ctypes.c_short(0),ctypes.byref(_datas),ctypes.byref( _var))
-                var_val = _var.value
-            else:
-                _var = dataVarTypes[_type.value][1](_size.value)
-                _datas = ctypes.c_short()
-                code = CFS64.GetVarVal(self._fileHandle, ctypes.c_short(x), ctypes.c_short(0),ctypes.byref(_datas),_var)
-                var_val = _var.value.decode()
-            dict = {"desc":_desc.value.decode(), "size": _size.value, "units": _units.value.decode(), "type":dataVarTypes[_type.value][0], "value": var_val}
-            files_vars.append(dict)
-        return files_vars
-
-    def _build_ds_vars(self):
+        return _get_file_vars(self._fileHandle, self.fileVarsCount)
+
+    def _build_ds_vars(self, names=None):
         ##Populate the DS Vars
-        ds_vars = []
-        #Create our ctypes to avoid memory hog
-        _size = ctypes.c_short()
-        _type = ctypes.c_short()
-        _units = ctypes.create_string_buffer(20)  
-        _desc = ctypes.create_string_buffer(50) 
-        for d in self.datasetList:
-            temp_ds_vars = []
-            for x in np.arange(self.datasetVarsCount+1):
-                _datas = ctypes.c_ushort(d)
-                CFS64.GetVarDesc(self._fileHandle, ctypes.c_short(x), ctypes.c_short(1), ctypes.byref(_size), ctypes.byref(_type), _units, _desc)
-                if _type.value != 7:
-                    _var = dataVarTypes[_type.value][1]()
-                    code = CFS64.GetVarVal(self._fileHandle, ctypes.c_short(x), ctypes.c_short(1),ctypes.byref(_datas),ctypes.byref(_var))
-                    var_val = _var
-                else:
-                    _var = dataVarTypes[_type.value][1](_size.value)
-                    code = CFS64.GetVarVal(self._fileHandle, ctypes.c_short(x), ctypes.c_short(1),ctypes.byref(_datas),_var)        
-                    var_val = _var.value.decode()
-                dict = {"desc":_desc.value.decode(), "size": _size.value, "units": _units.value.decode(), "type":dataVarTypes[_type.value][0], "value": var_val}
-           
-                temp_ds_vars.append(dict)
-            ds_vars.append(temp_ds_vars)
-        return ds_vars
+        return _get_ds_vars(self._fileHandle, self.datasetVarsCount, self.datasetList[:self.datasets], names=names)
 
     def _build_ch_vars(self):
         ### Populate Channel vars
-        ch_vars = []
-        _channame = ctypes.create_string_buffer(21) 
-        _xunits = ctypes.create_string_buffer(20) 
-        _yunits = ctypes.create_string_buffer(20)
-        _kind = ctypes.c_short()
-        _type = ctypes.c_short()
-        _spacing = ctypes.c_short()
-        _other = ctypes.c_short()
-        for ch in np.arange(self.channels):
-            _ch = ctypes.c_short(ch)
-            CFS64.GetFileChan(self._fileHandle, _ch, _channame, _yunits, _xunits, ctypes.byref(_type), ctypes.byref(_kind), ctypes.byref(_spacing), ctypes.byref(_other))
-            dict = {'Channel': ch, 'Channel Name': _channame.value.decode(), 'X Units': _xunits.value.decode(), 'Y Units': _yunits.value.decode(), 'Type': _type.value, 'Kind': _kind.value, 'Spacing': _spacing.value, 'Other': _other.value}
-            ch_vars.append(dict)
-        return ch_vars
+        return _get_ch_vars(self._fileHandle, self.channels)
 
     def _build_dsch_vars(self):
-        dsch_vars = []
-        _start = ctypes.c_long()
-        _points = ctypes.c_long()
-        _yscale = ctypes.c_float()
-        _yoffset = ctypes.c_float()
-        _xscale = ctypes.c_float()
-        _xoffset = ctypes.c_float()
-        for ch in np.arange(self.channels):
-            ds_dict = []
-            for x in np.arange(1,self.datasets+1):
-                CFS64.GetDSChan(self._fileHandle, 
-                               ctypes.c_short(ch), ##Channel
-                               ctypes.c_ushort(x),
-                               ctypes.byref(_start),
-                               ctypes.byref(_points),
-                               ctypes.byref(_yscale),
-                               ctypes.byref(_yoffset),
-                               ctypes.byref(_xscale),
-                               ctypes.byref(_xoffset),
-                                 )
-                dict = {'Channel': ch, 'ch start': _start.value, 'points': _points.value, 'yscale': _yscale.value, 'yoffset': _yoffset.value, 'xscale': _xscale.value, 'xoffset': _xoffset.value}
-                ds_dict.append(dict)
-            dsch_vars.append(ds_dict)
-        return dsch_vars
+        return _get_dsch_vars(self._fileHandle, self.channels, self.datasets)
 
     def _read_data(self):
         ##try to read data
         dataX = []
         dataY = []
-        chanData = CFS64.GetChanData
-        
         for ch in np.arange(0, self.channels):
             ch_x =[]
             ch_y = []
-            for x in np.arange(1,self.datasets +1):
-                channel_p = self.datasetChaVars[ch][x-1]['points'] * 2 ##Pull the datasize. the points are multiplied by 2 to reflect the x and Y data which are stacked horizontally.
-                dtype = dataVarTypes[self.chVars[ch]['Type']][1] #the datatype of the channel
-                ds_y, ds_x, pointsRead = self._read_data_incr(dtype, channel_p, ch, x)
-                
-                yscale = self.datasetChaVars[ch][x-1]['yscale']
-                yoffset = self.datasetChaVars[ch][x-1]['yoffset']
-                xscale = self.datasetChaVars[ch][x-1]['xscale']
-                xoffset = self.datasetChaVars[ch][x-1]['xoffset']
-                if pointsRead > 0:
-                    if dtype != ctypes.c_long:
-                        ds_y = ds_y * yscale + yoffset  #data is in int format must be scaled and offset with the variables 
-                    #ds_x = ds_x * xscale
-
-                    ds_x = np.cumsum(np.hstack((xoffset,np.full(int(channel_p/2)-1,xscale))))
-                
-
-                    ch_x.append(ds_x)
-               
-                    ch_y.append(ds_y)
+            for x in np.arange(0, self.datasets):
+                ds_x, ds_y = _decode_chan(self._fileHandle, self.chVars, self.datasetChaVars, ch, x)
+                ch_x.append(ds_x)
+                ch_y.append(ds_y)
             try:
                 ch_x = np.vstack(ch_x)
                 ch_y = np.vstack(ch_y)
@@ -279,34 +520,117 @@ class CFS(object):
         
         return dataX, dataY
 
+    def overview(self, channel, sweep, max_points=2000, t0=None, t1=None):
+        """
+        Returns (x, ymin, ymax) min/max envelopes of a sweep with at most max_points bins, optionally limited to the
+        time window [t0, t1) (see window_to_range, a channel without a time base is shown whole). Uses the overview pyramid of the channel if one was built or loaded, otherwise the
+        sweep is decimated directly. If the window already fits in max_points the raw data is returned as ymin and ymax.
+        """
+        x = self.dataX[channel][sweep]
+        y = self.dataY[channel][sweep]
+        first, count = window_to_range(self.datasetChaVars[channel][sweep], t0, t1)
+        i0, i1 = min(first, len(y)), min(first + count, len(y))
+        pyramid = self._overviews.get(channel, {}).get(sweep)
+        if pyramid is not None:
+            res = pyramid.view(i0, i1, max_points)
+            if res is not None:
+                idx, ymin, ymax = res
+                return x[idx], ymin, ymax
+            return x[i0:i1], y[i0:i1], y[i0:i1]
+        binsize = overview.binsize_for(i1 - i0, max_points)
+        if binsize == 1:
+            return x[i0:i1], y[i0:i1], y[i0:i1]
+        ymin, ymax = overview.minmax_decimate(y[i0:i1], binsize)
+        return x[i0:i1:binsize], ymin, ymax
+
+    def build_overview(self, channel, path=None, base=16, factor=4):
+        """
+        Builds the multi-resolution overview pyramid for every sweep of a channel, used by CFS.overview.
+        If path is given the pyramid is also saved there (.npz is appended if missing) and can be reloaded with
+        load_overview from the same path.
+        """
+        pyramids = {int(sweep): overview.OverviewPyramid.build(self.dataY[channel][sweep], base=base, factor=factor)
+                    for sweep in self.sweepList}
+        self._overviews[channel] = pyramids
+        if path is not None:
+            overview.save_pyramids(path, pyramids)
+        return pyramids
+
+    def load_overview(self, channel, path):
+        """Loads an overview pyramid saved by build_overview for a channel"""
+        self._overviews[channel] = overview.load_pyramids(path)
+        return self._overviews[channel]
+
+    def read_window(self, channel, sweep, t0=None, t1=None):
+        """
+        Returns (x, y) of the samples of a sweep within the time window [t0, t1), as views into dataX and dataY.
+        To read a window without loading the whole file use pyCEDFS.read_window or CFSReader.read_window.
+        """
+        if self.chVars[channel]['Kind'] == MATRIX:
+            raise ValueError(f"Channel {channel} is a matrix channel, its samples are not equally spaced in time")
+        first, count = window_to_range(self.datasetChaVars[channel][sweep], t0, t1)
+        return self.dataX[channel][sweep][first:first + count], self.dataY[channel][sweep][first:first + count]
+
+    def digest(self, per_sweep=True, source='raw', algorithm='blake2b'):
+        """
+        Returns content hashes of the sweep data, streamed block by block.
+        ______
+        per_sweep -> If True returns a dict {'algorithm', 'source', 'file', 'sweeps'} where sweeps[channel][sweep] is the
+                     hex digest of that sweep and file is the digest over all of them. Otherwise only the file digest.
+        source -> 'raw' hashes the raw on-disk samples (re-read from the file), 'data' hashes the decoded dataY
+                  arrays, which can be compared against data read back from e.g. an NWB conversion
+        algorithm -> Any hashlib algorithm, blake2b uses a 16 byte digest
+        """
+        if source not in ('raw', 'data'):
+            raise ValueError(f"source must be 'raw' or 'data', not {source}")
+        key = (source, algorithm)
+        if key not in self._digests:
+            sweeps = [[None] * self.datasets for _ in range(self.channels)]
+            if source == 'raw':
+                with handles.opened(self.cfsFilePath) as handle:
+                    for ch in range(self.channels):
+                        dtype = chanDataTypes[self.chVars[ch]['Type']]
+                        for sweep in range(self.datasets):
+                            h = _new_hash(algorithm)
+                            for block in _iter_chan_data(handle, ch, sweep + 1, dtype, self.datasetChaVars[ch][sweep]['points']):
+                                h.update(block)
+                            sweeps[ch][sweep] = h.hexdigest()
+            else:
+                for ch in range(self.channels):
+                    for sweep in range(self.datasets):
+                        h = _new_hash(algorithm)
+                        h.update(np.ascontiguousarray(self.dataY[ch][sweep]))
+                        sweeps[ch][sweep] = h.hexdigest()
+            fileHash = _new_hash(algorithm)
+            for chDigests in sweeps:
+                for d in chDigests:
+                    fileHash.update(bytes.fromhex(d))
+            self._digests[key] = {'algorithm': algorithm, 'source': source, 'file': fileHash.hexdigest(), 'sweeps': sweeps}
+        if per_sweep:
+            return self._digests[key]
+        return self._digests[key]['file']
+
+    def metadata_frame(self, table='datasets', summaries=False):
+        """
+        Returns a metadata table as a pandas DataFrame. table is one of 'file', 'datasets' (a row per sweep with a
+        column per DS variable), 'channels' or 'dataset_channels'. See pyCEDFS.tables
+        """
+        return tables.metadata_frame(self, table=table, summaries=summaries)
+
+    def to_arrow(self, table='datasets', summaries=False):
+        """Returns a metadata table as a pyarrow Table, see metadata_frame"""
+        return tables.to_arrow(self, table=table, summaries=summaries)
 
-    def _read_data_incr(self, dtype, channel_p, ch, ds, step_size=10000):
-        chanData = CFS64.GetChanData
-        full_data = []
-        channel_p = int(channel_p/2)
-        rounds = (channel_p//step_size) + 1
-        cl_points = 0
-        for x in np.arange(rounds):
-            _dataarray = (dtype * step_size)() ##Declare the array in memory for the function to return data into
-            chanData.argtypes = (ctypes.c_short,ctypes.c_short,ctypes.c_int,ctypes.c_ulonglong,ctypes.c_int, ctypes.POINTER(dtype), ctypes.c_ulonglong)
-            Size_ar = ctypes.sizeof(_dataarray)
-            pointsRead = chanData(self._fileHandle, 
-                                        ch, ##Channel
-                                        ds, ##DS
-                                        x*step_size, ##first element
-                                        step_size, ###Number of elements to pull 0==all
-                                        _dataarray, ###Dump into this array
-                                        Size_ar)##Number of data points provided
-            cl_points += pointsRead
-            data = np.ctypeslib.as_array(_dataarray) #convert the data into a numpy array
-            ds_y = np.copy(data[:int(channel_p/2)]) ##first half of the data is the Y value
-            ds_x = data[int(channel_p/2):] ##second half of the data appears to be X value, however if data is EQUALSPACED this is all zeros and we generate it later.
-            full_data.append(ds_y)
-        ret_data_y = np.hstack(full_data)[:int(channel_p)]
-        ret_data_x = np.full(ret_data_y.shape[0], 0)
-        return ret_data_y, ret_data_x, cl_points
-
-    def _debug_plot(self, fignum=0, figsize=(10,10)):
+    def aligned(self, channels, rate=None, method='linear', sweeps=None):
+        """
+        Returns the channels resampled onto one common time base per sweep, as Aligned(x, y, rate, sweeps) with
+        x and y[channel] (sweeps, points) arrays. rate defaults to the highest rate of the channels, method is
+        'linear' or 'poly'. See pyCEDFS.resample.align_channels
+        """
+        return resample.align_channels(self, channels, rate=rate, method=method, sweeps=sweeps)
+
+    def _debug_plot(self, fignum=0, figsize=(10,10), max_points=5000):
+            import matplotlib.pyplot as plt
             fig, axes = plt.subplots(nrows = self.channels, num=fignum, figsize=figsize)
             for x in np.arange(self.channels):
                 for a in np.arange(self.sweeps):
@@ -314,7 +638,9 @@ class CFS(object):
                         axes[x].set_title(self.chVars[x]['Channel Name'])
                         axes[x].set_ylabel(self.chVars[x]['Y Units'])
                         axes[x].set_xlabel(self.chVars[x]['X Units'])
-                        axes[int(x)].plot(self.dataX[int(x)][int(a)], self.dataY[int(x)][int(a)], label=f"{a}")
+                        #plot the min/max envelope, drawing every raw point of long sweeps is very slow
+                        env_x, env_y = overview.interleave(*self.overview(int(x), int(a), max_points=max_points))
+                        axes[int(x)].plot(env_x, env_y, label=f"{a}")
                     except:
                         log.warning(f"Error Plotting channel {x} sweep {a}")
 
@@ -325,18 +651,27 @@ class CFS(object):
     def _populate_attributes(self):
         ''' Populates attributes found on the ABF object from pyabf. Ideally
         ensuring that the CFS object can be put through the same pipeline as pyabf objects '''
-        str_time = "%a %b %d %H:%M:%S %Y"
         self.sweepCount = len(self.sweepList)
         self.channelCount = len(self.channelList)
         self.protocol = "Unknown"
         self.protocolPath = "Unknown"
-        last_mod = time.ctime(int(os.path.getmtime(self.cfsFilePath)))
-        self.cfsDateTime = datetime.datetime.strptime(last_mod, str_time)
+        self.cfsDateTime = file_datetime(self.cfsFilePath)
         self.cfsFileComment = self.fileComment
-        #Create a GUID on the fly
-        self.fileGUID = str(uuid.uuid4())
-        self.fileUUID = self.fileGUID
-        self.dataRate = 1/(self.dataX[0][0, 1] - self.dataX[0][0, 0])
+        #fileGUID and fileUUID are content derived properties, computed on first use
+        #rates come from the header xscale, so they don't depend on the decoded arrays
+        self.sampleRates = sample_rates(self.datasetChaVars)
+        self.dataRate = self.sampleRates[0, 0]
+
+    @property
+    def fileGUID(self):
+        """Stable identity of the file, a UUID formatted hash of the file contents (see file_identity)"""
+        if self._fileGUID is None:
+            self._fileGUID = str(uuid.UUID(bytes=bytes.fromhex(file_identity(self.cfsFilePath))[:16]))
+        return self._fileGUID
+
+    @property
+    def fileUUID(self):
+        return self.fileGUID
 
     def setSweep(self, sweepNumber, channel=None, absoluteTime=False):
 
@@ -355,29 +690,11 @@ class CFS(object):
 
         self.sweepNumber = sweepNumber
         self.sweepChannel = channel
-        self.sweepUnitsY = self.chVars[channel]['Y Units'].strip()
-        self.sweepUnitsC = self.chVars[0]['Y Units'].strip()
-        self.sweepUnitsX = "sec"
-        
-        # standard labels
-        self.sweepLabelY = "{} ({})".format(
-            self.chVars[channel]['Channel Name'], self.chVars[channel]['Y Units'])
-        self.sweepLabelC = "{} ({})".format(
-            self.chVars[0]['Channel Name'], self.chVars[0]['Y Units'])
-        self.sweepLabelX = "Time (seconds)"
-        self.sweepLabelD = "Digital Output (V)"
-
-        # use fancy labels for known units
-        if self.sweepUnitsY == "pA":
-            self.sweepLabelY = "Clamp Current (pA)"
-            self.sweepLabelC = "Membrane Potential (mV)"
-        elif self.sweepUnitsY == "mV":
-            self.sweepLabelY = "Membrane Potential (mV)"
-            self.sweepLabelC = "Applied Current (pA)"
+        (self.sweepUnitsY, self.sweepUnitsC, self.sweepUnitsX, self.sweepLabelY,
+         self.sweepLabelC, self.sweepLabelX, self.sweepLabelD) = self._sweep_labels(channel)
 
         if absoluteTime:
-            strt_time = np.sum([x[-1] for x in self.dataY[channel][:sweepNumber]])
-            self.sweepX = self.dataX[channel][sweepNumber] + strt_time
+            self.sweepX = self.dataX[channel][sweepNumber] + self._sweep_start_time(sweepNumber, channel)
         else:
             self.sweepX = self.dataX[channel][sweepNumber]
         self.sweepY = self.dataY[channel][sweepNumber]
@@ -386,6 +703,56 @@ class CFS(object):
         self.sweepPointCount = len(self.dataY[channel][sweepNumber])
         self._check_proper_units()
 
+    def sweep(self, sweepNumber, channel=None):
+        """
+        Returns a read-only Sweep view of the given sweep and channel. Unlike setSweep this does not
+        touch the state of the CFS object, so it can be used from several threads at once.
+        Views are cached, repeated calls for the same sweep and channel return the same object.
+        """
+        if channel is None:
+            channel = 0
+        if not (sweepNumber) in self.sweepList:
+            msg = "Sweep %d not available (must be 0 - %d)" % (
+                sweepNumber, len(self.sweepList)-1)
+            raise ValueError(msg)
+        if not channel in self.channelList:
+            msg = "Channel %d not available (must be 0 - %d)" % (
+                channel, len(self.channelList)-1)
+            raise ValueError(msg)
+        key = (int(sweepNumber), int(channel))
+        view = self._sweepViews.get(key)
+        if view is None:
+            #setdefault is atomic, so racing threads all end up sharing the first view stored
+            view = self._sweepViews.setdefault(key, Sweep(self, *key))
+        return view
+
+    def _sweep_labels(self, channel):
+        """Returns the pyABF-like (unitsY, unitsC, unitsX, labelY, labelC, labelX, labelD) for a channel
+        """
+        unitsY = self.chVars[channel]['Y Units'].strip()
+        unitsC = self.chVars[0]['Y Units'].strip()
+        unitsX = "sec"
+
+        # standard labels
+        labelY = "{} ({})".format(
+            self.chVars[channel]['Channel Name'], self.chVars[channel]['Y Units'])
+        labelC = "{} ({})".format(
+            self.chVars[0]['Channel Name'], self.chVars[0]['Y Units'])
+        labelX = "Time (seconds)"
+        labelD = "Digital Output (V)"
+
+        # use fancy labels for known units
+        if unitsY == "pA":
+            labelY = "Clamp Current (pA)"
+            labelC = "Membrane Potential (mV)"
+        elif unitsY == "mV":
+            labelY = "Membrane Potential (mV)"
+            labelC = "Applied Current (pA)"
+        return unitsY, unitsC, unitsX, labelY, labelC, labelX, labelD
+
+    def _sweep_start_time(self, sweepNumber, channel):
+        return np.sum([x[-1] for x in self.dataY[channel][:sweepNumber]])
+
     def _check_proper_units(self):
         """Checking for edge cases in units labels to allow for smoother transition
         """
@@ -393,9 +760,82 @@ class CFS(object):
             self.sweepUnitsC = 'pA'
         if 'uV' in self.sweepUnitsY:
             self.sweepUnitsY = 'mV'
-            self.sweepY  *= 0.001
-    
-            
-        
+            #Scale into a new array, scaling in place would rescale dataY on every call
+            self.sweepY = self.sweepY * 0.001
+
+
+class Sweep(object):
+    """
+    Read-only, pyABF-like view of a single sweep of a single channel. Returned by CFS.sweep().
+    Arrays are computed on first access and cached, unit-normalised the same way as CFS.setSweep.
+    ______
+    Attributes:
+    sweepX, sweepY, sweepC -> read-only numpy arrays
+    sweepUnitsX, sweepUnitsY, sweepUnitsC, sweepLabelX, sweepLabelY, sweepLabelC, sweepLabelD -> str
+    sweepPointCount -> int
+    """
+    __slots__ = ('_cfs', 'sweepNumber', 'sweepChannel', '_cache')
 
+    def __init__(self, cfs, sweepNumber, channel):
+        self._cfs = cfs
+        self.sweepNumber = sweepNumber
+        self.sweepChannel = channel
+        self._cache = {}
+
+    def __repr__(self):
+        return f"Sweep({self._cfs.CFSID!r}, sweep={self.sweepNumber}, channel={self.sweepChannel})"
 
+    def _get(self, key, func):
+        try:
+            return self._cache[key]
+        except KeyError:
+            return self._cache.setdefault(key, func())
+
+    @staticmethod
+    def _readonly(arr):
+        arr = np.asarray(arr).view()
+        arr.flags.writeable = False
+        return arr
+
+    def _labels(self):
+        unitsY, unitsC, unitsX, labelY, labelC, labelX, labelD = self._cfs._sweep_labels(self.sweepChannel)
+        if 'pAmp' in unitsC or 'pa' in unitsC:
+            unitsC = 'pA'
+        if 'uV' in unitsY:
+            unitsY = 'mV'
+        return unitsY, unitsC, unitsX, labelY, labelC, labelX, labelD
+
+    def _scaledY(self):
+        data = self._cfs.dataY[self.sweepChannel][self.sweepNumber]
+        if 'uV' in self._cfs.chVars[self.sweepChannel]['Y Units']:
+            data = data * 0.001
+        return self._readonly(data)
+
+    @property
+    def sweepX(self):
+        return self._get('X', lambda: self._readonly(self._cfs.dataX[self.sweepChannel][self.sweepNumber]))
+
+    @property
+    def sweepY(self):
+        return self._get('Y', self._scaledY)
+
+    @property
+    def sweepC(self):
+        return self._get('C', lambda: self._readonly(self._cfs.dataY[self.sweepChannel][self.sweepNumber]))
+
+    @property
+    def sweepPointCount(self):
+        return len(self._cfs.dataY[self.sweepChannel][self.sweepNumber])
+
+    @property
+    def sweepStartTime(self):
+        """Start time of the sweep as used by CFS.setSweep(absoluteTime=True)"""
+        return self._get('start', lambda: self._cfs._sweep_start_time(self.sweepNumber, self.sweepChannel))
+
+    sweepUnitsY = property(lambda self: self._get('labels', self._labels)[0])
+    sweepUnitsC = property(lambda self: self._get('labels', self._labels)[1])
+    sweepUnitsX = property(lambda self: self._get('labels', self._labels)[2])
+    sweepLabelY = property(lambda self: self._get('labels', self._labels)[3])
+    sweepLabelC = property(lambda self: self._get('labels', self._labels)[4])
+    sweepLabelX = property(lambda self: self._get('labels', self._labels)[5])
+    sweepLabelD = property(lambda self: self._get('labels', self._labels)[6])
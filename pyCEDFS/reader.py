@@ -0,0 +1,152 @@
+"""
+Long-lived, thread-safe reader for CFS files. Unlike pyCEDFS.CFS, which reads everything in __init__ and closes the
+file, the CFSReader keeps a small pool of DLL handles open and reads single sweeps on request.
+"""
+import os
+import queue
+import threading
+import logging
+from contextlib import contextmanager
+
+import numpy as np
+
+from . import pyCEDFS as _cfs
+from . import handles
+
+log = logging.getLogger(__name__)
+
+
+class CFSReader(object):
+    """
+    Long-lived CFS reader, safe to share between threads. Each call to read_sweep borrows one of `poolSize` open
+    handles, so up to `poolSize` reads run concurrently and each handle is only used by one thread at a time.
+    ______
+    Init:
+    cfsFilePath -> A str or os.path object pointing towards a CFS (.cfs) file
+    poolSize -> Number of DLL handles to keep open
+    handlePool -> Borrow handles from this handles.HandlePool (shared with other readers) instead of owning poolSize
+                  handles
+    ______
+    Usage:
+    with CFSReader('debug.cfs') as reader:
+        x, y = reader.read_sweep(channel, sweep)
+    """
+
+    def __init__(self, cfsFilePath, poolSize=4, handlePool=None):
+        self.cfsFilePath = os.path.abspath(cfsFilePath)
+        if not os.path.exists(self.cfsFilePath):
+            raise ValueError("CFS file does not exist: %s" % self.cfsFilePath)
+        if poolSize < 1:
+            raise ValueError("poolSize must be at least 1")
+        self.CFSID = os.path.splitext(os.path.basename(self.cfsFilePath))[0]
+
+        self._closeLock = threading.Lock()
+        self._closed = False
+        self._allHandles = []
+        self._handles = queue.Queue()
+        self._handlePool = handlePool
+        try:
+            for _ in range(poolSize if handlePool is None else 0):
+                handle = _cfs._open_handle(self.cfsFilePath)
+                self._allHandles.append(handle)
+                self._handles.put(handle)
+            with self._handle() as handle:
+                self.fileDate, self.fileTime, self.fileComment = _cfs._get_gen_info(handle)
+                self.channels, self.datasetVarsCount, self.fileVarsCount, self.datasets = _cfs._get_file_info(handle)
+                self.datasetList = np.arange(1, self.datasets+2)
+                self.fileVars = _cfs._get_file_vars(handle, self.fileVarsCount)
+                self.dsVars = _cfs._get_ds_vars(handle, self.datasetVarsCount, self.datasetList[:self.datasets])
+                self.chVars = _cfs._get_ch_vars(handle, self.channels)
+                self.datasetChaVars = _cfs._get_dsch_vars(handle, self.channels, self.datasets)
+                self.sampleRates = _cfs.sample_rates(self.datasetChaVars)
+        except BaseException:
+            self.close()
+            raise
+        log.debug(f"Opened reader for {self.CFSID} with {len(self._allHandles)} handles")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def _handle(self):
+        if self._closed:
+            raise ValueError("I/O operation on closed CFSReader")
+        if self._handlePool is not None:
+            with self._handlePool.acquire(self.cfsFilePath) as handle:
+                yield handle
+            return
+        handle = self._handles.get()
+        if handle is None or self._closed:
+            #closed while waiting: hand the handle (or the wake-up sentinel) on and fail
+            self._handles.put(handle)
+            raise ValueError("I/O operation on closed CFSReader")
+        try:
+            yield handle
+        finally:
+            self._handles.put(handle)
+
+    def _check(self, channel, sweep):
+        if not 0 <= channel < self.channels:
+            raise ValueError("Channel %d not available (must be 0 - %d)" % (channel, self.channels-1))
+        if not 0 <= sweep < self.datasets:
+            raise ValueError("Sweep %d not available (must be 0 - %d)" % (sweep, self.datasets-1))
+
+    def read_sweep(self, channel, sweep, raw=False):
+        """
+        Reads a single sweep (0-indexed, dataset sweep+1) of a channel.
+        Returns (x, y) numpy arrays, y is scaled to channel units unless raw is True. See pyCEDFS._decode_chan
+        """
+        self._check(channel, sweep)
+        with self._handle() as handle:
+            return _cfs._decode_chan(handle, self.chVars, self.datasetChaVars, channel, sweep, raw=raw)
+
+    def read_block(self, channel, sweep, first, count, raw=False):
+        """
+        Reads `count` points of a sweep starting at point `first`, without reading the rest of the sweep.
+        Returns (x, y) like read_sweep, shorter if the sweep ends before first + count.
+        """
+        self._check(channel, sweep)
+        first = max(int(first), 0)
+        count = max(min(int(count), self.datasetChaVars[channel][sweep]['points'] - first), 0)
+        with self._handle() as handle:
+            return _cfs._decode_chan(handle, self.chVars, self.datasetChaVars, channel, sweep, first=first, count=count, raw=raw)
+
+    def read_window(self, channel, sweep, t0=None, t1=None, raw=False):
+        """
+        Reads only the samples of a sweep within the time window [t0, t1) (X units), converted to a sample range with
+        the dataset's xoffset and xscale. Returns (x, y) like read_sweep.
+        """
+        self._check(channel, sweep)
+        if self.chVars[channel]['Kind'] == _cfs.MATRIX:
+            raise ValueError(f"Channel {channel} is a matrix channel, its samples are not equally spaced in time")
+        first, count = _cfs.window_to_range(self.datasetChaVars[channel][sweep], t0, t1)
+        return self.read_block(channel, sweep, first, count, raw=raw)
+
+    def close(self):
+        """Closes all handles. Waits for in-flight reads to return their handle first. Handles borrowed from a
+        handlePool stay open in the pool."""
+        with self._closeLock:
+            if self._closed:
+                return
+            self._closed = True
+            errors = []
+            for _ in range(len(self._allHandles)):
+                try:
+                    handles.close_handle(self._handles.get())
+                except handles.CFSError as e:
+                    errors.append(e)
+            self._allHandles = []
+            #wakes reads that passed the closed check and are waiting for a handle, each passes it on
+            self._handles.put(None)
+            if errors:
+                raise errors[0]
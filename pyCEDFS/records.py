@@ -0,0 +1,80 @@
+"""
+Compact metadata records for the fileVars, dsVars, chVars and datasetChaVars lists of a CFS file.
+Records use __slots__ instead of a per-instance dict, and the repeated strings are interned, while still behaving like
+the dicts they replace: record['Channel Name'], record.get('units'), dict(record), json.dumps(dict(record)) all work.
+"""
+import sys
+from collections.abc import Mapping
+
+
+class _Record(Mapping):
+    """
+    Base class for the slotted records. Subclasses declare __slots__ (attribute names) and _keys
+    (the matching dict keys, in the same order).
+    """
+    __slots__ = ()
+    _keys = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._slotForKey = dict(zip(cls._keys, cls.__slots__))
+
+    def __init__(self, *args):
+        for slot, value in zip(self.__slots__, args):
+            setattr(self, slot, value)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self._slotForKey[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, self._slotForKey[key], value)
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, slot) for slot in self.__slots__))
+
+    def to_dict(self):
+        """Returns the record as a plain dict with the original keys"""
+        return {key: getattr(self, slot) for key, slot in self._slotForKey.items()}
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class VarRecord(_Record):
+    """A file or DS variable. Keys: desc, size, units, type, value"""
+    __slots__ = ('desc', 'size', 'units', 'type', 'value')
+    _keys = ('desc', 'size', 'units', 'type', 'value')
+
+    def __init__(self, desc, size, units, type, value):
+        super().__init__(_intern(desc), size, _intern(units), _intern(type), value)
+
+
+class ChannelRecord(_Record):
+    """A channel. Keys: Channel, Channel Name, X Units, Y Units, Type, Kind, Spacing, Other"""
+    __slots__ = ('channel', 'name', 'xUnits', 'yUnits', 'type', 'kind', 'spacing', 'other')
+    _keys = ('Channel', 'Channel Name', 'X Units', 'Y Units', 'Type', 'Kind', 'Spacing', 'Other')
+
+    def __init__(self, channel, name, xUnits, yUnits, type, kind, spacing, other):
+        super().__init__(channel, _intern(name), _intern(xUnits), _intern(yUnits), type, kind, spacing, other)
+
+
+class DSChannelRecord(_Record):
+    """A channel in a single dataset. Keys: Channel, ch start, points, yscale, yoffset, xscale, xoffset"""
+    __slots__ = ('channel', 'start', 'points', 'yscale', 'yoffset', 'xscale', 'xoffset')
+    _keys = ('Channel', 'ch start', 'points', 'yscale', 'yoffset', 'xscale', 'xoffset')
@@ -0,0 +1,217 @@
+"""
+Resampling of (sweeps, points) arrays, and alignment of channels recorded at different rates onto one common time base.
+Every step works on a whole batch of sweeps at once: filters are one FFT convolution along the last axis and linear
+interpolation is a single gather over all sweeps, so there is no np.interp call per sweep.
+"""
+import fractions
+import collections
+import logging
+
+import numpy as np
+
+from . import pyCEDFS as _cfs
+
+log = logging.getLogger(__name__)
+
+RESAMPLE_METHODS = ('linear', 'poly')
+
+#Tolerance (in samples) for target times that land on the first or last sample
+_EDGE_TOLERANCE = 1e-6
+
+Aligned = collections.namedtuple('Aligned', ['x', 'y', 'rate', 'sweeps'])
+
+
+def lowpass_taps(cutoff, numtaps=None, beta=8.0):
+    """
+    Returns the taps of a linear phase FIR low pass (Kaiser windowed sinc) with unit DC gain.
+    cutoff is a fraction of the Nyquist frequency in (0, 1], numtaps defaults to 20 / cutoff (made odd).
+    """
+    if not 0 < cutoff <= 1:
+        raise ValueError(f"cutoff must be in (0, 1], not {cutoff}")
+    if numtaps is None:
+        numtaps = 2 * int(np.ceil(10.0 / cutoff)) + 1
+    numtaps = int(numtaps) | 1
+    n = np.arange(numtaps) - (numtaps - 1) / 2.0
+    taps = cutoff * np.sinc(cutoff * n) * np.kaiser(numtaps, beta)
+    return taps / taps.sum()
+
+
+def _pad_edges(data, pad):
+    """Extends the last axis by repeating the first and last sample `pad` times, to keep filter transients out"""
+    if pad <= 0:
+        return data
+    return np.concatenate((np.repeat(data[..., :1], pad, axis=-1), data, np.repeat(data[..., -1:], pad, axis=-1)), axis=-1)
+
+
+def _convolve_same(data, taps):
+    """Convolves every row of a (..., points) array with odd length taps, centred so the output lines up with the input"""
+    n = data.shape[-1]
+    m = len(taps)
+    nfft = 1 << (n + m - 2).bit_length()
+    out = np.fft.irfft(np.fft.rfft(data, nfft, axis=-1) * np.fft.rfft(taps, nfft), nfft, axis=-1)
+    start = (m - 1) // 2
+    return out[..., start:start + n]
+
+
+def lowpass(data, cutoff, numtaps=None):
+    """Low pass filters a (..., points) array along its last axis, cutoff as a fraction of Nyquist (see lowpass_taps)"""
+    data = np.asarray(data, dtype=np.float64)
+    taps = lowpass_taps(cutoff, numtaps)
+    pad = len(taps) // 2
+    return _convolve_same(_pad_edges(data, pad), taps)[..., pad:pad + data.shape[-1]]
+
+
+def resample_poly(data, up, down, numtaps=None):
+    """
+    Polyphase resampling of a (..., points) array along its last axis by the rational factor up / down: zero stuffing
+    by `up`, anti-alias/anti-imaging low pass at 1 / max(up, down) of Nyquist, and keeping every `down`-th sample.
+    Returns ceil(points * up / down) samples per row, sample 0 stays at the same time as input sample 0.
+    """
+    ratio = fractions.Fraction(int(up), int(down))
+    if ratio <= 0:
+        raise ValueError(f"up and down must be positive, not {up} and {down}")
+    up, down = ratio.numerator, ratio.denominator
+    data = np.asarray(data, dtype=np.float64)
+    n = data.shape[-1]
+    if up == down == 1:
+        return data.copy()
+    taps = lowpass_taps(1.0 / max(up, down), numtaps) * up
+    #pad in the input domain, padding the stuffed signal would repeat its zeros
+    pad = (len(taps) // 2) // up + 1
+    padded = _pad_edges(data, pad)
+    stuffed = np.zeros(padded.shape[:-1] + (padded.shape[-1] * up,))
+    stuffed[..., ::up] = padded
+    filtered = _convolve_same(stuffed, taps)[..., pad * up:(pad + n) * up]
+    return filtered[..., ::down][..., :-(-n * up // down)]
+
+
+def decimate(data, factor, numtaps=None):
+    """Anti-alias filters a (..., points) array along its last axis and keeps every `factor`-th sample"""
+    if int(factor) < 1:
+        raise ValueError(f"factor must be at least 1, not {factor}")
+    return resample_poly(data, 1, int(factor), numtaps=numtaps)
+
+
+def interp_linear(data, t, x0, dx, lengths=None, fill=np.nan):
+    """
+    Linear interpolation of equally spaced sweeps at the times t, for all sweeps in one gather.
+    ______
+    data -> (sweeps, points) array, sample i of sweep s is at time x0[s] + i * dx[s]
+    t -> (points_out,) or (sweeps, points_out) target times
+    x0, dx -> scalars or (sweeps,) arrays, e.g. the xoffset and xscale of each dataset
+    lengths -> valid points of each sweep for ragged data padded to a rectangle, default all
+    fill -> Value of targets outside a sweep
+    ______
+    Returns a (sweeps, points_out) array
+    """
+    data = np.asarray(data, dtype=np.float64)
+    sweeps, n = data.shape
+    t = np.broadcast_to(np.asarray(t, dtype=np.float64), (sweeps, np.shape(t)[-1]))
+    x0 = np.broadcast_to(np.asarray(x0, dtype=np.float64), (sweeps,))[:, None]
+    dx = np.broadcast_to(np.asarray(dx, dtype=np.float64), (sweeps,))[:, None]
+    lengths = np.full((sweeps, 1), n) if lengths is None else np.asarray(lengths).reshape(sweeps, 1)
+    pos = (t - x0) / dx
+    valid = (pos >= -_EDGE_TOLERANCE) & (pos <= lengths - 1 + _EDGE_TOLERANCE)
+    #NaN targets (past the end of a sweep) are masked by valid, silence their cast
+    with np.errstate(invalid='ignore'):
+        i0 = np.clip(np.floor(pos).astype(np.int64), 0, max(n - 2, 0))
+        frac = np.clip(pos - i0, 0.0, 1.0)
+    i1 = np.minimum(i0 + 1, n - 1)
+    y0 = np.take_along_axis(data, i0, axis=1)
+    y1 = np.take_along_axis(data, i1, axis=1)
+    out = y0 + (y1 - y0) * frac
+    out[~valid] = fill
+    return out
+
+
+def _stack(channelData, sweeps):
+    """Returns the selected sweeps of a channel as a (sweeps, points) float array padded with each sweep's last
+    sample, and the number of valid points per sweep"""
+    rows = [np.asarray(channelData[s], dtype=np.float64) for s in sweeps]
+    lengths = np.array([len(r) for r in rows], dtype=np.int64)
+    if lengths.size and (lengths == lengths[0]).all():
+        return np.stack(rows) if rows[0].size else np.zeros((len(rows), 1)), lengths
+    out = np.empty((len(rows), max(int(lengths.max()), 1)))
+    for i, r in enumerate(rows):
+        out[i, :len(r)] = r
+        out[i, len(r):] = r[-1] if len(r) else 0.0
+    return out, lengths
+
+
+def _to_time_base(data, lengths, x0, dx, t, rate, method, antialias, maxDenominator):
+    """Resamples the sweeps of one channel (all with the same dx) onto the target times t"""
+    sourceRate = 1.0 / dx
+    if method == 'poly':
+        ratio = fractions.Fraction(rate / sourceRate).limit_denominator(maxDenominator)
+        if ratio != 1:
+            data = resample_poly(data, ratio.numerator, ratio.denominator)
+            lengths = -(-lengths * ratio.numerator // ratio.denominator)
+            dx = dx * ratio.denominator / ratio.numerator
+    elif antialias and sourceRate > rate * (1 + _EDGE_TOLERANCE):
+        data = lowpass(data, rate / sourceRate)
+    #remaining sub-sample offsets between the channels are taken up by linear interpolation
+    return interp_linear(data, t, x0, dx, lengths=lengths)
+
+
+def align_channels(cfs, channels, rate=None, method='linear', sweeps=None, antialias=True, maxDenominator=1000):
+    """
+    Resamples channels recorded at different rates (xscale) onto one common time base per sweep.
+    ______
+    cfs -> A CFS (or SharedCFS) with dataY, chVars and datasetChaVars
+    channels -> The channels to align, equally spaced or subsidiary channels only
+    rate -> Target rate in samples per X unit, default the highest rate of the channels
+    method -> 'linear' interpolates (after an anti-alias low pass when a channel is downsampled and antialias is set),
+              'poly' uses polyphase resampling by the rational ratio of the rates (denominator at most
+              maxDenominator), followed by linear interpolation for sub-sample offsets between the channels
+    sweeps -> Sweep numbers to align, default all
+    ______
+    Returns Aligned(x, y, rate, sweeps): x is a (sweeps, points) array of times starting at the latest channel start of
+    each sweep, y a dict {channel: (sweeps, points) array}. Times past the earliest channel end of a sweep are NaN.
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f"method must be one of {RESAMPLE_METHODS}, not {method}")
+    channels = [int(ch) for ch in channels]
+    if not channels:
+        raise ValueError("No channels to align")
+    if sweeps is None:
+        sweeps = range(len(cfs.datasetChaVars[channels[0]]))
+    sweeps = np.asarray(sweeps, dtype=np.int64)
+
+    x0 = {}
+    dx = {}
+    for ch in channels:
+        if cfs.chVars[ch]['Kind'] == _cfs.MATRIX:
+            raise ValueError(f"Channel {ch} is a matrix channel, its samples are not equally spaced in time")
+        dsch = cfs.datasetChaVars[ch]
+        x0[ch] = np.array([dsch[s]['xoffset'] for s in sweeps], dtype=np.float64)
+        dx[ch] = np.array([dsch[s]['xscale'] for s in sweeps], dtype=np.float64)
+        if not (dx[ch] > 0).all():
+            raise ValueError(f"Channel {ch} has sweeps without a time base (xscale <= 0)")
+    if rate is None:
+        rate = max(1.0 / dx[ch].min() for ch in channels)
+    rate = float(rate)
+    dt = 1.0 / rate
+
+    data = {}
+    lengths = {}
+    for ch in channels:
+        data[ch], lengths[ch] = _stack(cfs.dataY[ch], sweeps)
+    #common window of each sweep: from the latest channel start to the earliest channel end
+    start = np.max([x0[ch] for ch in channels], axis=0)
+    end = np.min([x0[ch] + (lengths[ch] - 1) * dx[ch] for ch in channels], axis=0)
+    counts = np.floor((end - start) / dt + _EDGE_TOLERANCE).astype(np.int64) + 1
+    points = max(int(counts.max()) if counts.size else 0, 0)
+    x = start[:, None] + np.arange(points) * dt
+    x[np.arange(points)[None, :] >= counts[:, None]] = np.nan
+
+    y = {}
+    for ch in channels:
+        out = np.empty((len(sweeps), points))
+        #sweeps sharing a sampling interval are resampled as one batch
+        for value in np.unique(dx[ch]):
+            rows = np.flatnonzero(dx[ch] == value)
+            out[rows] = _to_time_base(data[ch][rows], lengths[ch][rows], x0[ch][rows], value, x[rows], rate,
+                                      method, antialias, maxDenominator)
+        y[ch] = out
+    log.debug(f"Aligned channels {channels} over {len(sweeps)} sweeps onto {points} points at rate {rate:g}")
+    return Aligned(x, y, rate, sweeps)
@@ -0,0 +1,123 @@
+"""
+Shared memory sweep server. One process decodes a CFS file into multiprocessing.shared_memory blocks and publishes a
+small picklable descriptor (block names, shapes, dtypes, chVars and datasetChaVars); other processes attach to it and
+get zero-copy, read-only numpy views instead of their own copy of dataY. Blocks are reference counted and unlinked
+when the last process releases them.
+
+The descriptor carries a multiprocessing.Lock guarding the count, so it has to reach the worker processes when they
+are started: as Process args, or through the initializer/initargs of a multiprocessing Pool or ProcessPoolExecutor.
+"""
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from . import parallel
+from .reader import CFSReader
+
+log = logging.getLogger(__name__)
+
+
+def _attach_block(name):
+    try:
+        #attaching processes must not unlink the block when they exit, only the last release does
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: #track was added in python 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedCFS(object):
+    """
+    CFS data held in shared memory. Create it with SharedCFS.publish(path) in one process and
+    SharedCFS.attach(descriptor) in the others.
+    ______
+    Attributes:
+    dataX, dataY -> Read-only views in the CFS.dataX / CFS.dataY layout
+    chVars, datasetChaVars, fileVars, dsVars -> The file metadata
+    descriptor -> The picklable descriptor to hand to other processes
+    ______
+    Usage:
+    shared = SharedCFS.publish('debug.cfs', workers=8)
+    with ProcessPoolExecutor(initializer=init_worker, initargs=(shared.descriptor,)) as pool: ...
+    #in init_worker: cfs = SharedCFS.attach(descriptor)
+    shared.release()
+    """
+
+    def __init__(self, descriptor, blocks):
+        self.descriptor = descriptor
+        self.cfsFilePath = descriptor['cfsFilePath']
+        self.chVars = descriptor['chVars']
+        self.datasetChaVars = descriptor['datasetChaVars']
+        self.fileVars = descriptor['fileVars']
+        self.dsVars = descriptor['dsVars']
+        self.channels = len(self.chVars)
+        self.datasets = descriptor['lengths'].shape[1]
+        self._blocks = blocks
+        self._released = False
+        arrays = []
+        for ch in range(self.channels):
+            pair = []
+            for name, shape, dtype in descriptor['specs'][ch]:
+                arr = np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+                arr.flags.writeable = False
+                pair.append(arr)
+            arrays.append(tuple(pair))
+        self.dataX, self.dataY = parallel.views_from_blocks(arrays, descriptor['lengths'])
+
+    @classmethod
+    def publish(cls, cfsFilePath, workers=1, useProcesses=True):
+        """Decodes a CFS file into shared memory (on `workers` processes) and returns the owning SharedCFS"""
+        with CFSReader(cfsFilePath, poolSize=1) as reader:
+            meta = dict(cfsFilePath=reader.cfsFilePath, chVars=reader.chVars, datasetChaVars=reader.datasetChaVars,
+                        fileVars=reader.fileVars, dsVars=reader.dsVars)
+        blocks, specs, lengths = parallel.decode_to_blocks(meta['cfsFilePath'], meta['chVars'], meta['datasetChaVars'],
+                                                           workers=workers, useProcesses=useProcesses)
+        refcount = shared_memory.SharedMemory(create=True, size=8)
+        np.ndarray((1,), dtype=np.int64, buffer=refcount.buf)[0] = 1
+        blocks.append(refcount)
+        descriptor = dict(meta, specs=specs, lengths=lengths, refcount=refcount.name, lock=multiprocessing.Lock())
+        return cls(descriptor, {shm.name: shm for shm in blocks})
+
+    @classmethod
+    def attach(cls, descriptor):
+        """Attaches to published data as zero-copy views, and takes a reference on the blocks"""
+        names = [descriptor['refcount']] + [spec[0] for ch in sorted(descriptor['specs']) for spec in descriptor['specs'][ch]]
+        with descriptor['lock']:
+            refcount = _attach_block(descriptor['refcount'])
+            count = np.ndarray((1,), dtype=np.int64, buffer=refcount.buf)
+            if count[0] <= 0:
+                del count
+                refcount.close()
+                raise ValueError(f"The shared data of {descriptor['cfsFilePath']} has already been released")
+            count[0] += 1
+            del count
+            blocks = {descriptor['refcount']: refcount}
+            blocks.update({name: _attach_block(name) for name in names[1:]})
+        return cls(descriptor, blocks)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+    def release(self):
+        """Drops this process' views and reference. The last release unlinks the blocks."""
+        if self._released:
+            return
+        self._released = True
+        self.dataX = self.dataY = None
+        with self.descriptor['lock']:
+            count = np.ndarray((1,), dtype=np.int64, buffer=self._blocks[self.descriptor['refcount']].buf)
+            count[0] -= 1
+            last = count[0] <= 0
+            del count
+            for shm in self._blocks.values():
+                shm.close()
+                if last:
+                    shm.unlink()
+        self._blocks = {}
+        if last:
+            log.debug(f"Released shared data of {self.cfsFilePath}")
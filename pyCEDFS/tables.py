@@ -0,0 +1,123 @@
+"""
+Columnar metadata tables for a loaded CFS file, for building pandas DataFrames or Arrow tables (and from there
+Parquet) without looping over lists of dicts. Tables are built as {column: numpy array} dicts:
+    'file'             -> one row, the header info and file variables
+    'datasets'         -> one row per dataset (sweep) with a column per DS variable
+    'channels'         -> one row per channel (chVars)
+    'dataset_channels' -> one row per (channel, sweep) with datasetChaVars, and optionally summary statistics
+Every table has a 'file' column with the CFSID so tables of many files can be concatenated and joined.
+"""
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+TABLES = ('file', 'datasets', 'channels', 'dataset_channels')
+
+
+def _unique_names(names):
+    seen = {}
+    out = []
+    for name in names:
+        name = name.strip() or 'var'
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 0
+        out.append(name)
+    return out
+
+
+def _column(values):
+    if all(isinstance(v, str) for v in values):
+        return np.array(values, dtype=object)
+    return np.array(values)
+
+
+def _summaries(cfs, ch):
+    """Returns (mean, std, min, max) per sweep of a channel, vectorized over the (sweeps, points) array"""
+    data = cfs.dataY[ch]
+    if isinstance(data, np.ndarray) and data.ndim == 2 and data.shape[1]:
+        return np.nanmean(data, axis=1), np.nanstd(data, axis=1), np.nanmin(data, axis=1), np.nanmax(data, axis=1)
+    stats = np.full((4, len(data)), np.nan)
+    for sweep, y in enumerate(data):
+        if len(y):
+            stats[:, sweep] = np.nanmean(y), np.nanstd(y), np.nanmin(y), np.nanmax(y)
+    return tuple(stats)
+
+
+def metadata_tables(cfs, summaries=False):
+    """
+    Returns {table name: {column: numpy array}} for a loaded pyCEDFS.CFS, see the module docstring.
+    If summaries is True the dataset_channels table gets mean, std, min and max columns of each sweep.
+    """
+    datasets = cfs.datasets
+    channels = cfs.channels
+    fileName = cfs.CFSID
+
+    fileTable = {
+        'file': np.array([fileName], dtype=object),
+        'path': np.array([cfs.cfsFilePath], dtype=object),
+        'date': np.array([cfs.fileDate], dtype=object),
+        'time': np.array([cfs.fileTime], dtype=object),
+        'comment': np.array([cfs.fileComment], dtype=object),
+        'channels': np.array([channels]),
+        'datasets': np.array([datasets]),
+    }
+    for name, var in zip(_unique_names([v['desc'] for v in cfs.fileVars]), cfs.fileVars):
+        fileTable.setdefault(name, _column([var['value']]))
+
+    dsTable = {'file': np.full(datasets, fileName, dtype=object), 'sweep': np.arange(datasets)}
+    dsVars = cfs.dsVars[:datasets]
+    if dsVars:
+        for i, name in enumerate(_unique_names([v['desc'] for v in dsVars[0]])):
+            dsTable.setdefault(name, _column([ds[i]['value'] for ds in dsVars]))
+
+    chTable = {'file': np.full(channels, fileName, dtype=object)}
+    for key, name in zip(('Channel', 'Channel Name', 'X Units', 'Y Units', 'Type', 'Kind', 'Spacing', 'Other'),
+                         ('channel', 'name', 'x_units', 'y_units', 'type', 'kind', 'spacing', 'other')):
+        chTable[name] = _column([ch[key] for ch in cfs.chVars])
+
+    rows = [d for ch in cfs.datasetChaVars for d in ch]
+    dschTable = {
+        'file': np.full(len(rows), fileName, dtype=object),
+        'channel': np.repeat(np.arange(channels), datasets),
+        'sweep': np.tile(np.arange(datasets), channels),
+    }
+    for key, name in zip(('ch start', 'points', 'yscale', 'yoffset', 'xscale', 'xoffset'),
+                         ('start', 'points', 'yscale', 'yoffset', 'xscale', 'xoffset')):
+        dschTable[name] = np.array([d[key] for d in rows])
+    if summaries:
+        stats = [np.concatenate(s) if channels else np.empty(0) for s in zip(*[_summaries(cfs, ch) for ch in range(channels)])]
+        for name, values in zip(('mean', 'std', 'min', 'max'), stats):
+            dschTable[name] = values
+
+    return {'file': fileTable, 'datasets': dsTable, 'channels': chTable, 'dataset_channels': dschTable}
+
+
+def _table(cfs, table, summaries):
+    if table not in TABLES:
+        raise ValueError(f"table must be one of {TABLES}, not {table}")
+    return metadata_tables(cfs, summaries=summaries and table == 'dataset_channels')[table]
+
+
+def metadata_frame(cfs, table='datasets', summaries=False):
+    """Returns one of the metadata tables as a pandas DataFrame (requires pandas)"""
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError("metadata_frame requires the pandas package (pip install pandas)") from None
+    return pd.DataFrame(_table(cfs, table, summaries))
+
+
+def to_arrow(cfs, table='datasets', summaries=False):
+    """Returns one of the metadata tables as a pyarrow Table (requires pyarrow)"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("to_arrow requires the pyarrow package (pip install pyarrow)") from None
+    columns = _table(cfs, table, summaries)
+    return pa.table({name: pa.array(values.tolist() if values.dtype == object else values)
+                     for name, values in columns.items()})
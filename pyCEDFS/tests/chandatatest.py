@@ -0,0 +1,67 @@
+import ctypes
+
+import numpy as np
+
+import pyCEDFS
+from pyCEDFS import pyCEDFS as _cfs
+
+
+class FakeLibrary(object):
+    """Stands in for the CFS DLL: GetChanData serves `available` points of a ramp, then returns `fail`"""
+
+    def __init__(self, available, fail=0):
+        self.available = available
+        self.fail = fail
+
+    def GetChanData(self, handle, ch, ds, first, count, buffer, size):
+        count = min(count, self.available - first)
+        if count <= 0:
+            return self.fail
+        ctypes.memmove(buffer, (ctypes.c_short * count)(*range(first, first + count)), count * 2)
+        return count
+
+
+def expect_error(func, code):
+    try:
+        func()
+    except pyCEDFS.CFSError as e:
+        assert e.code == code, e.code
+    else:
+        raise AssertionError("truncated read returned without an error")
+
+
+def check_get_chan_data():
+    _cfs.CFS64 = FakeLibrary(25)
+    data, points = _cfs._get_chan_data(1, 0, 1, ctypes.c_short, 25, step_size=10)
+    assert points == 25 and np.array_equal(data, np.arange(25))
+    data, points = _cfs._get_chan_data(1, 0, 1, ctypes.c_short, 5, first=20, step_size=2)
+    assert np.array_equal(data, np.arange(20, 25))
+    #a sweep ending early and a DLL error code both raise instead of returning a short array
+    expect_error(lambda: _cfs._get_chan_data(1, 0, 1, ctypes.c_short, 30, step_size=10), -13)
+    _cfs.CFS64 = FakeLibrary(25, fail=-24)
+    expect_error(lambda: _cfs._get_chan_data(1, 0, 1, ctypes.c_short, 30, step_size=10), -24)
+
+
+def check_iter_chan_data():
+    _cfs.CFS64 = FakeLibrary(25)
+    blocks = [block.copy() for block in _cfs._iter_chan_data(1, 0, 1, ctypes.c_short, 25, step_size=10)]
+    assert [len(b) for b in blocks] == [10, 10, 5] and np.array_equal(np.concatenate(blocks), np.arange(25))
+    #the blocks read before the failure are yielded, then the generator raises
+    expect_error(lambda: list(_cfs._iter_chan_data(1, 0, 1, ctypes.c_short, 30, step_size=10)), -13)
+    _cfs.CFS64 = FakeLibrary(25, fail=-24)
+    expect_error(lambda: list(_cfs._iter_chan_data(1, 0, 1, ctypes.c_short, 30, step_size=10)), -24)
+
+
+def main():
+    library = _cfs.CFS64
+    try:
+        check_get_chan_data()
+        check_iter_chan_data()
+    finally:
+        _cfs.CFS64 = library
+    print("channel data reads ok")
+    return
+
+
+if __name__ == "__main__":
+    main()
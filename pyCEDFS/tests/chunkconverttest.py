@@ -0,0 +1,103 @@
+import os
+import types
+import hashlib
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+from pynwb import NWBFile, NWBHDF5IO, TimeSeries
+
+from pyCEDFS.CFSConverter import CFSConverter, SweepChunkIterator
+
+POINTS = (1000, 357)
+SCALE = 0.001
+
+
+class FakeReader(object):
+    """Stands in for a CFSReader, serving the sweeps of fake_cfs by block"""
+
+    def __init__(self, cfs):
+        self.cfs = cfs
+        self.datasetChaVars = cfs.datasetChaVars
+
+    def read_block(self, channel, sweep, first, count):
+        return (self.cfs.dataX[channel][sweep][first:first + count],
+                self.cfs.dataY[channel][sweep][first:first + count])
+
+
+def fake_cfs():
+    rng = np.random.default_rng(1)
+    #scaled int16 samples, as _scale_chan_data returns them for an ADC channel
+    dataY = [[rng.integers(-2**15, 2**15, n).astype(np.int16) * 0.0030517578 + 0.1 for n in POINTS]]
+    dataX = [[np.arange(n) * 1e-4 for n in POINTS]]
+    dsch = [[{'points': n, 'xscale': 1e-4, 'xoffset': 0.0} for n in POINTS]]
+    return types.SimpleNamespace(cfsFilePath='fake.cfs', dataX=dataX, dataY=dataY, datasetChaVars=dsch)
+
+
+def converter(cfs, bufferSize, compression=False):
+    #only the parts of the converter that write series data, without opening any file
+    con = CFSConverter.__new__(CFSConverter)
+    con.bufferSize = bufferSize
+    con.compression = compression
+    con._readers = {cfs.cfsFilePath: FakeReader(cfs)}
+    return con
+
+
+def check_iterator():
+    cfs = fake_cfs()
+    reader = FakeReader(cfs)
+    for bufferSize in (1, 64, 1000, 5000):
+        chunks = list(SweepChunkIterator(reader, 0, 1, bufferSize, scale=SCALE))
+        assert all(chunk.data.dtype == np.float32 for chunk in chunks)
+        assert chunks[0].selection.start == 0 and chunks[-1].selection.stop == POINTS[1]
+        data = np.concatenate([chunk.data for chunk in chunks])
+        assert np.array_equal(data, (cfs.dataY[0][1] * SCALE).astype(np.float32))
+
+
+def check_series_data():
+    cfs = fake_cfs()
+    chPlan = {'channel': 0, 'scale': SCALE}
+    for sweep in range(len(POINTS)):
+        inMemory = converter(cfs, None)._seriesData(cfs, chPlan, sweep)
+        expected = np.asarray(getattr(inMemory, 'data', inMemory))
+        assert expected.dtype == np.float32
+        for compression in (False, True):
+            streamed = converter(cfs, 100, compression)._seriesData(cfs, chPlan, sweep)
+            iterator = streamed.data if compression else streamed
+            assert isinstance(iterator, SweepChunkIterator)
+            assert np.array_equal(np.concatenate([chunk.data for chunk in iterator]), expected)
+
+
+def check_written_digest():
+    #the recorded data digest matches a hash of series.data[:] read back from the file, for both paths
+    cfs = fake_cfs()
+    chPlan = {'channel': 0, 'scale': SCALE}
+    with tempfile.TemporaryDirectory() as tmp:
+        for bufferSize in (None, 100):
+            con = converter(cfs, bufferSize, compression=True)
+            digests = [con._dataDigest(cfs, 0, sweep, SCALE, 'blake2b') for sweep in range(len(POINTS))]
+            nwb = NWBFile(session_description='test', identifier='test', session_start_time=datetime.now(timezone.utc))
+            for sweep in range(len(POINTS)):
+                nwb.add_acquisition(TimeSeries(name=f'index_{sweep}', data=con._seriesData(cfs, chPlan, sweep),
+                                               unit='V', rate=10000.0))
+            path = os.path.join(tmp, f'{bufferSize}.nwb')
+            with NWBHDF5IO(path, 'w') as io:
+                io.write(nwb)
+            with NWBHDF5IO(path, 'r') as io:
+                read = io.read()
+                for sweep, digest in enumerate(digests):
+                    data = read.acquisition[f'index_{sweep}'].data[:]
+                    assert data.shape == (POINTS[sweep],) and data.dtype == np.float32
+                    assert hashlib.blake2b(data.tobytes(), digest_size=16).hexdigest() == digest
+
+
+def main():
+    check_iterator()
+    check_series_data()
+    check_written_digest()
+    print("streamed conversion ok")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import types
+
+import numpy as np
+
+from pyCEDFS import events
+
+
+def fake_cfs(sweeps, xscale=0.001, xoffset=0.0):
+    #stands in for a loaded pyCEDFS.CFS, detect_events only needs dataY and datasetChaVars
+    dsch = [{'points': len(y), 'xscale': xscale, 'xoffset': xoffset} for y in sweeps]
+    return types.SimpleNamespace(dataY=[sweeps], datasetChaVars=[dsch])
+
+
+def check_crossings():
+    y = np.array([0.0, 2.0, 0.0, 2.0, 2.0, 0.0])
+    assert list(events.crossings(y, 1.0)) == [1, 3]
+    assert list(events.crossings(y, 1.0, direction='falling')) == [2, 5]
+    assert list(events.crossings(y, 1.0, direction='both')) == [1, 2, 3, 5]
+    #landing exactly on the threshold counts once
+    assert list(events.crossings([0.0, 1.0, 2.0], 1.0)) == [1]
+    try:
+        events.crossings(y, 1.0, direction='up')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown direction accepted")
+
+
+def check_refractory():
+    assert list(events.apply_refractory([10, 12, 15, 30], 5)) == [10, 15, 30]
+    assert list(events.apply_refractory([10, 12, 15, 30], 0)) == [10, 12, 15, 30]
+    #the last event of the previous block still counts
+    assert list(events.apply_refractory([3, 9], 5, last=0)) == [9]
+
+
+def check_block_boundaries():
+    rng = np.random.default_rng(0)
+    sweeps = [rng.normal(size=5000), rng.normal(size=3001)]
+    cfs = fake_cfs(sweeps)
+    for derivative in (False, True):
+        threshold = 1500.0 if derivative else 1.5
+        whole = events.detect_events(cfs, 0, threshold, derivative=derivative, refractory=0.003, blockSize=10**6)
+        assert whole.size
+        #crossings on block edges must be found once, whatever the block size
+        for blockSize in (1, 7, 64, 1000):
+            blocked = events.detect_events(cfs, 0, threshold, derivative=derivative, refractory=0.003,
+                                           blockSize=blockSize)
+            assert np.array_equal(whole, blocked), (derivative, blockSize)
+    found = events.detect_events(cfs, 0, 1.5, sweeps=[1])
+    assert np.all(found['sweep'] == 1)
+    assert np.allclose(found['time'], found['index'] * 0.001)
+    assert np.array_equal(found['amplitude'], sweeps[1][found['index']])
+    #no time base: levels can still be searched, a derivative can not
+    cfs = fake_cfs(sweeps, xscale=0.0)
+    assert np.array_equal(events.detect_events(cfs, 0, 1.5)['index'], np.concatenate([events.crossings(y, 1.5) for y in sweeps]))
+    try:
+        events.detect_events(cfs, 0, 1500.0, derivative=True)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("derivative computed without a time base")
+
+
+def main():
+    check_crossings()
+    check_refractory()
+    check_block_boundaries()
+    print("events ok")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import subprocess
+import sys
+
+#Modules that should only be imported when the feature using them is first used
+HEAVY_MODULES = ['matplotlib', 'pkg_resources', 'pynwb', 'x_to_nwb', 'asyncio', 'sqlite3', 'multiprocessing']
+MAX_IMPORT_SECONDS = 1.0
+
+IMPORT_CHECK = """
+import sys, time
+t = time.perf_counter()
+import pyCEDFS
+print(time.perf_counter() - t)
+print(','.join(m for m in {modules} if m in sys.modules))
+print(pyCEDFS.CFS64.loaded)
+"""
+
+
+def main():
+    #run in a fresh interpreter so nothing is already imported
+    out = subprocess.run([sys.executable, "-c", IMPORT_CHECK.format(modules=HEAVY_MODULES)],
+                         check=True, capture_output=True, text=True).stdout.split('\n')
+    seconds, imported, loaded = float(out[0]), out[1], out[2]
+    print(f"import pyCEDFS took {seconds*1000:.1f} ms")
+    assert imported == '', f"import pyCEDFS eagerly imported: {imported}"
+    assert loaded == 'False', "import pyCEDFS eagerly loaded the CFS library"
+    assert seconds < MAX_IMPORT_SECONDS, f"import pyCEDFS took {seconds:.2f} s"
+    return
+
+
+if __name__ == "__main__":
+    main()
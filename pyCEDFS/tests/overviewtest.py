@@ -0,0 +1,63 @@
+import os
+import tempfile
+
+import numpy as np
+
+from pyCEDFS import overview
+
+
+def check_minmax_decimate():
+    y = np.array([3.0, 1.0, 4.0, 1.0, 5.0, 9.0, 2.0])
+    ymin, ymax = overview.minmax_decimate(y, 3)
+    assert np.array_equal(ymin, [1.0, 1.0, 2.0]) and np.array_equal(ymax, [4.0, 9.0, 2.0])
+    ymin, ymax = overview.minmax_decimate(np.stack((y, -y)), 7)
+    assert np.array_equal(ymin, [[1.0], [-9.0]]) and np.array_equal(ymax, [[9.0], [-1.0]])
+    assert overview.binsize_for(10000, 2000) == 5
+    assert overview.binsize_for(10001, 2000) == 6
+
+
+def check_pyramid():
+    y = np.sin(np.linspace(0, 50, 100000))
+    pyramid = overview.OverviewPyramid.build(y, base=16, factor=4)
+    assert pyramid.binsizes[0] == 16 and all(b * 4 == c for b, c in zip(pyramid.binsizes, pyramid.binsizes[1:]))
+    assert pyramid.view(0, 1000, max_points=2000) is None
+    x, ymin, ymax = pyramid.view(0, None, max_points=2000)
+    assert len(x) <= 2000 and x[0] == 0
+    #every level bounds the raw data it covers
+    assert np.isclose(ymin.min(), y.min()) and np.isclose(ymax.max(), y.max())
+    #fewer bins than the coarsest level has, it is folded further
+    for max_points in (1, 50, 97):
+        x, ymin, ymax = pyramid.view(0, None, max_points=max_points)
+        assert len(x) == len(ymin) == len(ymax) <= max_points
+        assert ymin.min() == pyramid.mins[-1].min() and ymax.max() == pyramid.maxs[-1].max()
+    x, ymin, ymax = pyramid.view(5000, 90000, max_points=10)
+    assert len(x) <= 10 and x[0] <= 5000 and np.all(np.diff(x) > 0)
+    noise = overview.OverviewPyramid.build(np.random.default_rng(0).random(100000))
+    assert len(noise.view(0, None, 50)[0]) <= 50
+
+
+def check_save_load():
+    pyramids = {sweep: overview.OverviewPyramid.build(np.arange(5000.0) * (sweep + 1)) for sweep in range(3)}
+    with tempfile.TemporaryDirectory() as tmp:
+        #np.savez appends .npz, loading has to find the file from the same path
+        for name in ('overview', 'overview.npz'):
+            path = os.path.join(tmp, name)
+            written = overview.save_pyramids(path, pyramids)
+            assert written == os.path.join(tmp, 'overview.npz') and os.path.exists(written)
+            loaded = overview.load_pyramids(path)
+            assert sorted(loaded) == [0, 1, 2]
+            for sweep, pyramid in pyramids.items():
+                assert loaded[sweep].points == pyramid.points and loaded[sweep].binsizes == pyramid.binsizes
+                assert all(np.array_equal(a, b) for a, b in zip(loaded[sweep].maxs, pyramid.maxs))
+
+
+def main():
+    check_minmax_decimate()
+    check_pyramid()
+    check_save_load()
+    print("overview ok")
+    return
+
+
+if __name__ == "__main__":
+    main()
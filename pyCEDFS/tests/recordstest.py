@@ -0,0 +1,46 @@
+import json
+import pickle
+
+from pyCEDFS.records import VarRecord, ChannelRecord, DSChannelRecord
+
+
+def check_records():
+    ch = ChannelRecord(1, 'Vm', 's', 'mV', 2, 0, 2, -1)
+    assert ch['Channel Name'] == 'Vm' and ch.name == 'Vm' and ch.get('missing') is None
+    assert list(ch) == ['Channel', 'Channel Name', 'X Units', 'Y Units', 'Type', 'Kind', 'Spacing', 'Other']
+    assert dict(ch) == ch.to_dict() and len(ch) == 8
+    assert json.loads(json.dumps(dict(ch)))['Y Units'] == 'mV'
+    ch['Y Units'] = 'V'
+    assert ch.yUnits == 'V'
+    try:
+        ch['nope']
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("unknown key read")
+    try:
+        ch['nope'] = 1
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("unknown key written")
+    assert not hasattr(ch, '__dict__')
+
+    var = VarRecord('Sweep count', 2, '', 'INT2', 12)
+    assert pickle.loads(pickle.dumps(var)) == var
+    #repeated strings are shared between records
+    assert VarRecord(''.join(['Swe', 'ep count']), 2, '', 'INT2', 1)['desc'] is var['desc']
+
+    dsch = DSChannelRecord(0, 0, 100, 0.5, 0.0, 1e-4, 0.0)
+    assert dsch == {'Channel': 0, 'ch start': 0, 'points': 100, 'yscale': 0.5, 'yoffset': 0.0, 'xscale': 1e-4,
+                    'xoffset': 0.0}
+
+
+def main():
+    check_records()
+    print("records ok")
+    return
+
+
+if __name__ == "__main__":
+    main()
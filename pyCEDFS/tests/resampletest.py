@@ -0,0 +1,78 @@
+import types
+
+import numpy as np
+
+import pyCEDFS
+from pyCEDFS import resample
+
+
+def check_filters():
+    taps = resample.lowpass_taps(0.25)
+    assert len(taps) % 2 == 1 and np.isclose(taps.sum(), 1.0)
+    #DC passes, a tone above the cutoff is removed
+    n = np.arange(4000)
+    assert np.allclose(resample.lowpass(np.ones((2, 500)), 0.25), 1.0)
+    high = resample.lowpass(np.sin(0.9 * np.pi * n), 0.25)
+    assert np.abs(high[200:-200]).max() < 1e-3
+
+
+def check_resample_poly():
+    t = np.arange(1000) / 1000.0
+    y = np.sin(2 * np.pi * 5 * t)
+    up = resample.resample_poly(y, 3, 2)
+    assert up.shape == (1500,)
+    assert np.allclose(up[::3], y[::2], atol=1e-3)
+    down = resample.decimate(np.stack((y, 2 * y)), 4)
+    assert down.shape == (2, 250)
+    assert np.allclose(down[:, 20:-20], np.stack((y, 2 * y))[:, ::4][:, 20:-20], atol=1e-3)
+    assert np.array_equal(resample.resample_poly(y, 2, 2), y)
+
+
+def check_interp_linear():
+    data = np.array([[0.0, 1.0, 2.0, 3.0], [0.0, 10.0, 20.0, 0.0]])
+    out = resample.interp_linear(data, [0.5, 1.5, 3.0, 3.5], 0.0, 1.0, lengths=[4, 3])
+    assert np.allclose(out[0, :3], [0.5, 1.5, 3.0]) and np.isnan(out[0, 3])
+    #the second sweep has 3 valid points, so t=3 is outside it
+    assert np.allclose(out[1, :2], [5.0, 15.0]) and np.isnan(out[1, 2:]).all()
+    out = resample.interp_linear(data, [1.0, 2.0], x0=[0.0, 1.0], dx=[1.0, 0.5])
+    assert np.allclose(out, [[1.0, 2.0], [0.0, 20.0]])
+
+
+def check_align_channels():
+    #channel 0 at 1 kHz, channel 1 at 250 Hz over the same second, both a 2 Hz sine
+    rates = (1000.0, 250.0)
+    dataY, dsch = [], []
+    for rate in rates:
+        t = np.arange(int(rate)) / rate
+        dataY.append(np.stack((np.sin(2 * np.pi * 2 * t), np.cos(2 * np.pi * 2 * t))))
+        dsch.append([{'points': int(rate), 'xscale': 1.0 / rate, 'xoffset': 0.0}] * 2)
+    chVars = [{'Kind': pyCEDFS.EQUALSPACED}, {'Kind': pyCEDFS.EQUALSPACED}]
+    cfs = types.SimpleNamespace(dataY=dataY, chVars=chVars, datasetChaVars=dsch)
+    for method in resample.RESAMPLE_METHODS:
+        aligned = resample.align_channels(cfs, [0, 1], method=method)
+        assert aligned.rate == 1000.0 and aligned.x.shape == (2, 997)
+        assert np.allclose(aligned.y[0], dataY[0][:, :997])
+        assert np.allclose(aligned.y[1][:, 20:-20], dataY[0][:, 20:977], atol=5e-3), method
+    aligned = resample.align_channels(cfs, [0, 1], rate=250.0, sweeps=[1])
+    assert aligned.x.shape == (1, 250) and np.array_equal(aligned.sweeps, [1])
+    assert np.allclose(aligned.y[1], dataY[1][1])
+    cfs.chVars = [{'Kind': pyCEDFS.MATRIX}, chVars[1]]
+    try:
+        resample.align_channels(cfs, [0, 1])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("matrix channel accepted")
+
+
+def main():
+    check_filters()
+    check_resample_poly()
+    check_interp_linear()
+    check_align_channels()
+    print("resample ok")
+    return
+
+
+if __name__ == "__main__":
+    main()
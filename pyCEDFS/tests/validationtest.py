@@ -0,0 +1,25 @@
+import numpy as np
+
+from pyCEDFS.validation import _nan_sweeps
+
+
+def check_nan_sweeps():
+    nan = np.nan
+    assert list(_nan_sweeps(np.array([[1.0, 2.0], [nan, 1.0], [3.0, 4.0]]))) == [1]
+    assert list(_nan_sweeps(np.array([[1, 2], [3, 4]], dtype=np.int16))) == []
+    #ragged channels, with empty sweeps anywhere
+    assert list(_nan_sweeps([np.array([1.0, 2.0, nan]), np.array([])])) == [0]
+    assert list(_nan_sweeps([np.array([]), np.array([nan]), np.array([]), np.array([1.0, nan])])) == [1, 3]
+    assert list(_nan_sweeps([np.array([1.0]), np.array([2.0, 3.0])])) == []
+    assert list(_nan_sweeps([np.array([]), np.array([])])) == []
+    assert list(_nan_sweeps([])) == []
+
+
+def main():
+    check_nan_sweeps()
+    print("_nan_sweeps ok")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import numpy as np
+
+import pyCEDFS
+
+#xscale is read from a c_float, so 1e-4 is 9.9999997e-05 like in a real file
+XSCALE = float(np.float32(1e-4))
+
+
+def check_window_to_range():
+    dsch = {'points': 10000, 'xoffset': 0.0, 'xscale': XSCALE}
+    #[t0, t1) keeps the sample at t0 and drops the one at t1
+    assert pyCEDFS.window_to_range(dsch, 0.05, 0.1) == (500, 500)
+    assert pyCEDFS.window_to_range(dsch, 0.05005, 0.1) == (501, 499)
+    assert pyCEDFS.window_to_range(dsch, None, None) == (0, 10000)
+    assert pyCEDFS.window_to_range(dsch, -1.0, 0.0) == (0, 0)
+    assert pyCEDFS.window_to_range(dsch, 0.9, 5.0) == (9000, 1000)
+    assert pyCEDFS.window_to_range(dsch, 0.2, 0.1) == (2000, 0)
+    #long sweeps, where the float32 error of xscale adds up to a good part of a sample
+    dsch = {'points': 2000000, 'xoffset': 0.0, 'xscale': XSCALE}
+    assert pyCEDFS.window_to_range(dsch, 150.0, 160.0) == (1500000, 100000)
+    assert pyCEDFS.window_to_range(dsch, 150.00005, None) == (1500001, 499999)
+    dsch = {'points': 100, 'xoffset': 0.5, 'xscale': float(np.float32(0.001))}
+    assert pyCEDFS.window_to_range(dsch, 0.51, 0.52) == (10, 10)
+    #no time base, the whole sweep
+    assert pyCEDFS.window_to_range({'points': 5, 'xoffset': 0.0, 'xscale': 0.0}, 1.0, 2.0) == (0, 5)
+
+
+def main():
+    check_window_to_range()
+    print("window_to_range ok")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Vectorized validation of a loaded CFS file. Each check runs over the stacked per-channel (sweeps, points) arrays in one
+numpy pass instead of selecting every sweep with setSweep, and the results are collected in a ValidationReport.
+For a CFS loaded with load_data=False the data checks stream each sweep from the file block by block instead.
+"""
+import collections
+import contextlib
+import logging
+
+import numpy as np
+
+from . import pyCEDFS as _cfs
+from . import handles
+
+log = logging.getLogger(__name__)
+
+#X units accepted as seconds
+SECOND_UNITS = ('s', 'sec', 'secs', 'second', 'seconds')
+
+Issue = collections.namedtuple('Issue', ['check', 'severity', 'channel', 'sweeps', 'message'])
+
+
+class ValidationReport(object):
+    """
+    Result of validate(). `issues` is a list of Issue(check, severity, channel, sweeps, message) where severity is
+    'error' or 'warning' and sweeps is an array of the affected sweep numbers.
+    """
+
+    def __init__(self, cfsFilePath, issues):
+        self.cfsFilePath = cfsFilePath
+        self.issues = issues
+
+    def __repr__(self):
+        return f"ValidationReport({self.cfsFilePath!r}, errors={len(self.errors)}, warnings={len(self.warnings)})"
+
+    @property
+    def errors(self):
+        return [i for i in self.issues if i.severity == 'error']
+
+    @property
+    def warnings(self):
+        return [i for i in self.issues if i.severity == 'warning']
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def raise_for_errors(self):
+        """Raises a ValueError for the first error in the report, if any"""
+        for issue in self.errors:
+            raise ValueError(issue.message)
+
+
+def _nan_sweeps(data):
+    """Returns the sweep numbers containing NaN for a (sweeps, points) array or a ragged list of sweeps"""
+    if isinstance(data, np.ndarray) and data.ndim == 2:
+        if not np.issubdtype(data.dtype, np.floating):
+            return np.array([], dtype=np.int64)
+        return np.flatnonzero(np.isnan(data).any(axis=1))
+    #ragged channel, flatten once and reduce per sweep
+    lengths = np.array([len(d) for d in data], dtype=np.int64)
+    if not lengths.size or not lengths.sum():
+        return np.array([], dtype=np.int64)
+    flat = np.concatenate([np.asarray(d, dtype=np.float64) for d in data])
+    #NaN count per sweep, empty sweeps own no elements of flat and count 0
+    nans = np.bincount(np.repeat(np.arange(lengths.size), lengths), weights=np.isnan(flat), minlength=lengths.size)
+    return np.flatnonzero(nans > 0)
+
+
+def _streamed_counts(handle, cfs, ch):
+    """Returns (decoded points per sweep, sweeps containing NaN) of a channel, read from the file block by block"""
+    dtype = _cfs.chanDataTypes[cfs.chVars[ch]['Type']]
+    decoded = []
+    nan_sweeps = []
+    for sweep, dsch in enumerate(cfs.datasetChaVars[ch]):
+        points = 0
+        nan = False
+        for block in _cfs._iter_chan_data(handle, ch, sweep + 1, dtype, dsch['points']):
+            points += block.shape[0]
+            nan = nan or bool(np.isnan(_cfs._scale_chan_data(block, dsch)).any())
+        decoded.append(points)
+        if nan:
+            nan_sweeps.append(sweep)
+    return np.array(decoded, dtype=np.int64), np.array(nan_sweeps, dtype=np.int64)
+
+
+def validate(cfs, channels=None):
+    """
+    Validates a loaded pyCEDFS.CFS object. Checks the given channels (default: all) for
+    - NaN samples (error)
+    - sweeps with no data points (error), or fewer decoded points than the header declares (warning)
+    - X units that are not seconds (warning)
+    - a time base (xscale) that changes between sweeps of a channel, or differs between channels (warning)
+    - ragged channels, where sweeps have different lengths (warning)
+    If cfs.dataY is None (CFS(..., load_data=False)) the NaN and point checks read the file in blocks.
+    Returns a ValidationReport.
+    """
+    issues = []
+    source = cfs.cfsFilePath
+    if channels is None:
+        channels = cfs.channelList
+    channels = [int(ch) for ch in channels]
+    if not channels:
+        return ValidationReport(source, issues)
+
+    dsch = cfs.datasetChaVars
+    declared = np.array([[d['points'] for d in dsch[ch]] for ch in channels], dtype=np.int64)
+    xscale = np.array([[d['xscale'] for d in dsch[ch]] for ch in channels], dtype=np.float64)
+
+    streamed = cfs.dataY is None
+    with (handles.opened(cfs.cfsFilePath) if streamed else contextlib.nullcontext()) as handle:
+        counts = {}
+        for ch in channels:
+            if streamed:
+                counts[ch] = _streamed_counts(handle, cfs, ch)
+                continue
+            data = cfs.dataY[ch]
+            if isinstance(data, np.ndarray) and data.ndim == 2:
+                decoded = np.full(data.shape[0], data.shape[1], dtype=np.int64)
+            else:
+                decoded = np.array([len(d) for d in data], dtype=np.int64)
+            counts[ch] = decoded, _nan_sweeps(data)
+
+    for row, ch in enumerate(channels):
+        decoded, nan_sweeps = counts[ch]
+        if nan_sweeps.size:
+            issues.append(Issue('nan', 'error', ch, nan_sweeps,
+                                f"Found at least one 'Not a Number' "
+                                f"entry in channel {ch} of sweep {nan_sweeps[0]} "
+                                f"in file {source} using protocol {getattr(cfs, 'protocol', 'Unknown')}."))
+
+        empty = np.flatnonzero(declared[row] <= 0)
+        if empty.size:
+            issues.append(Issue('points', 'error', ch, empty,
+                                f"Channel {ch} has no data points in sweeps {empty.tolist()} in file {source}."))
+        n = min(decoded.shape[0], declared.shape[1])
+        short = np.flatnonzero(decoded[:n] < declared[row, :n])
+        if short.size or decoded.shape[0] < declared.shape[1]:
+            missing = np.union1d(short, np.arange(decoded.shape[0], declared.shape[1]))
+            issues.append(Issue('points', 'warning', ch, missing,
+                                f"Channel {ch} decoded fewer points than declared in sweeps {missing.tolist()} in file {source}."))
+
+        units = cfs.chVars[ch]['X Units'].strip().lower()
+        if units and units not in SECOND_UNITS:
+            issues.append(Issue('units', 'warning', ch, np.array([], dtype=np.int64),
+                                f"Unexpected x units of {cfs.chVars[ch]['X Units']} on channel {ch}."))
+
+        changed = np.flatnonzero(~np.isclose(xscale[row], xscale[row, 0]))
+        if changed.size:
+            issues.append(Issue('timebase', 'warning', ch, changed,
+                                f"Channel {ch} changes sample interval in sweeps {changed.tolist()}."))
+
+        if declared[row].size and declared[row].min() != declared[row].max():
+            ragged = np.flatnonzero(declared[row] != declared[row, 0])
+            issues.append(Issue('ragged', 'warning', ch, ragged,
+                                f"Channel {ch} has sweeps of different lengths ({declared[row].min()} - {declared[row].max()} points)."))
+
+    rates = xscale[:, 0] if xscale.shape[1] else np.array([])
+    if rates.size and not np.allclose(rates, rates[0]):
+        issues.append(Issue('timebase', 'warning', None, np.array([], dtype=np.int64),
+                            f"Channels {channels} do not share a sample interval ({np.unique(rates).tolist()})."))
+    return ValidationReport(source, issues)
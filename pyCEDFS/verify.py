@@ -0,0 +1,239 @@
+"""
+Cross-checks the read paths of pyCEDFS against each other. Every backend reads the metadata (fileVars, dsVars, chVars,
+datasetChaVars) and the scaled and, where it has them, raw samples of a file; everything is compared to the CFSReader
+and the time each backend takes is reported side by side. Also installed as the `pycedfs-verify` command:
+
+    pycedfs-verify "Signal Demo/Data" --backends cfs parallel npy shared --workers 8
+
+Backends:
+    'reader'   -> CFSReader, one DLL handle reading sweep by sweep (the reference)
+    'cfs'      -> pyCEDFS.CFS, decoded in __init__
+    'parallel' -> pyCEDFS.CFS decoded on `workers` processes
+    'npy'      -> an export_store 'npy' store (scaled and raw), read back through the memmap
+    'zarr'     -> an export_store 'zarr' store (requires the zarr package)
+    'shared'   -> SharedCFS.publish, read through the shared memory views
+Data is compared value for value (NaN equal to NaN), so a mismatch means the paths return different samples.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import collections
+import functools
+import logging
+
+import numpy as np
+
+from . import pyCEDFS as _cfs
+from .reader import CFSReader
+from .export import export_file, open_store, _jsonable
+
+log = logging.getLogger(__name__)
+
+BACKENDS = ('reader', 'cfs', 'parallel', 'npy', 'zarr', 'shared')
+DEFAULT_BACKENDS = ('reader', 'cfs', 'npy', 'shared')
+METADATA = ('fileVars', 'dsVars', 'chVars', 'datasetChaVars')
+
+Mismatch = collections.namedtuple('Mismatch', ['field', 'channel', 'sweep', 'message'])
+BackendResult = collections.namedtuple('BackendResult', ['backend', 'seconds', 'setup', 'mismatches', 'error'])
+
+#What a backend read: the metadata, and scaled[ch][sweep] / raw[ch][sweep] arrays (raw is None if not available)
+_Snapshot = collections.namedtuple('_Snapshot', ['meta', 'scaled', 'raw'])
+
+
+def _meta(source):
+    return {key: _jsonable(getattr(source, key)) for key in METADATA}
+
+
+def _rows(data, points):
+    """Splits a (channel, sweep, sample) store array into exact length sweeps"""
+    return [[np.array(data[ch, sweep, :points[ch][sweep]]) for sweep in range(len(points[ch]))]
+            for ch in range(len(points))]
+
+
+def _read_reader(cfsFilePath, workers, tmp):
+    with CFSReader(cfsFilePath, poolSize=1) as reader:
+        scaled = [[reader.read_sweep(ch, sweep)[1] for sweep in range(reader.datasets)] for ch in range(reader.channels)]
+        raw = [[reader.read_sweep(ch, sweep, raw=True)[1] for sweep in range(reader.datasets)] for ch in range(reader.channels)]
+        return _Snapshot(_meta(reader), scaled, raw), 0.0
+
+
+def _read_cfs(cfsFilePath, workers, tmp, parallel=False):
+    cfs = _cfs.CFS(cfsFilePath, workers=workers if parallel else None)
+    scaled = [[cfs.dataY[ch][sweep] for sweep in range(cfs.datasets)] for ch in range(cfs.channels)]
+    return _Snapshot(_meta(cfs), scaled, None), 0.0
+
+
+def _read_store(cfsFilePath, workers, tmp, format='npy'):
+    start = time.perf_counter()
+    stores = {}
+    for raw in (False, True):
+        stores[raw] = export_file(cfsFilePath, os.path.join(tmp, f"{format}-{'raw' if raw else 'scaled'}"),
+                                  format=format, raw=raw, workers=workers)
+    setup = time.perf_counter() - start
+    data, attrs = open_store(stores[False])
+    scaled = _rows(data, attrs['points'])
+    rawData, _ = open_store(stores[True])
+    raw = _rows(rawData, attrs['points'])
+    del data, rawData
+    return _Snapshot({key: attrs[key] for key in METADATA}, scaled, raw), setup
+
+
+def _read_shared(cfsFilePath, workers, tmp):
+    from .shared import SharedCFS
+    with SharedCFS.publish(cfsFilePath, workers=workers) as shared:
+        scaled = [[np.array(shared.dataY[ch][sweep]) for sweep in range(shared.datasets)] for ch in range(shared.channels)]
+        return _Snapshot(_meta(shared), scaled, None), 0.0
+
+
+_READERS = {
+    'reader': _read_reader,
+    'cfs': _read_cfs,
+    'parallel': functools.partial(_read_cfs, parallel=True),
+    'npy': _read_store,
+    'zarr': functools.partial(_read_store, format='zarr'),
+    'shared': _read_shared,
+}
+
+
+def _compare_data(field, ref, other):
+    mismatches = []
+    for ch, (refCh, otherCh) in enumerate(zip(ref, other)):
+        for sweep, (a, b) in enumerate(zip(refCh, otherCh)):
+            a = np.asarray(a)
+            b = np.asarray(b)
+            if a.shape != b.shape:
+                mismatches.append(Mismatch(field, ch, sweep, f"{b.shape[0]} points, expected {a.shape[0]}"))
+            elif not np.array_equal(a, b, equal_nan=a.dtype.kind == 'f' and b.dtype.kind == 'f'):
+                diff = np.flatnonzero(a != b)
+                worst = np.nanmax(np.abs(a.astype(np.float64) - b.astype(np.float64)))
+                mismatches.append(Mismatch(field, ch, sweep, f"{diff.size} samples differ from index {diff[0]}, "
+                                                             f"max difference {worst:g}"))
+    return mismatches
+
+
+def compare(ref, other):
+    """Returns the list of Mismatch between two snapshots"""
+    mismatches = []
+    for key in METADATA:
+        if ref.meta[key] != other.meta[key]:
+            mismatches.append(Mismatch(key, None, None, f"{key} differs"))
+    if len(ref.scaled) != len(other.scaled):
+        mismatches.append(Mismatch('data', None, None, f"{len(other.scaled)} channels, expected {len(ref.scaled)}"))
+        return mismatches
+    mismatches.extend(_compare_data('data', ref.scaled, other.scaled))
+    if other.raw is not None:
+        mismatches.extend(_compare_data('raw', ref.raw, other.raw))
+    return mismatches
+
+
+def verify_file(cfsFilePath, backends=DEFAULT_BACKENDS, workers=4):
+    """
+    Reads a CFS file through each backend and compares it to the CFSReader.
+    ______
+    cfsFilePath -> A CFS file
+    backends -> Names from BACKENDS, 'reader' is always run first as the reference
+    workers -> Workers for the 'parallel', store and 'shared' backends
+    ______
+    Returns a list of BackendResult(backend, seconds, setup, mismatches, error). seconds is the time to read all
+    metadata and data, setup the time spent exporting a store first. error is the exception text if the backend failed.
+    """
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        raise ValueError(f"Unknown backends {sorted(unknown)}, must be in {BACKENDS}")
+    order = ['reader'] + [b for b in backends if b != 'reader']
+    results = []
+    ref = None
+    tmp = tempfile.mkdtemp(prefix='pycedfs-verify-')
+    try:
+        for backend in order:
+            start = time.perf_counter()
+            try:
+                snapshot, setup = _READERS[backend](cfsFilePath, workers, tmp)
+            except Exception as e:
+                if backend == 'reader':
+                    raise
+                log.debug(f"Backend {backend} failed on {cfsFilePath}", exc_info=True)
+                results.append(BackendResult(backend, time.perf_counter() - start, 0.0, [], f"{type(e).__name__}: {e}"))
+                continue
+            seconds = time.perf_counter() - start - setup
+            if ref is None:
+                ref = snapshot
+                mismatches = []
+            else:
+                mismatches = compare(ref, snapshot)
+            results.append(BackendResult(backend, seconds, setup, mismatches, None))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def find_files(path, recursive=True):
+    """Returns the .cfs files below a folder, or [path] for a file"""
+    if os.path.isfile(path):
+        return [path]
+    if not os.path.isdir(path):
+        raise ValueError(f"{path} is neither a folder nor a path.")
+    found = []
+    for root, dirs, files in os.walk(path):
+        found.extend(os.path.join(root, name) for name in files if name.lower().endswith('.cfs'))
+        if not recursive:
+            break
+    return sorted(found)
+
+
+def format_report(cfsFilePath, results, maxMismatches=10):
+    """Returns a text table of one file's results"""
+    lines = [cfsFilePath, f"  {'backend':<10} {'seconds':>9} {'setup':>9}  result"]
+    for r in results:
+        if r.error is not None:
+            status = f"ERROR {r.error}"
+        elif r.mismatches:
+            status = f"{len(r.mismatches)} MISMATCHES"
+        else:
+            status = "ok" if r.backend != 'reader' else "reference"
+        setup = f"{r.setup:9.3f}" if r.setup else f"{'-':>9}"
+        lines.append(f"  {r.backend:<10} {r.seconds:9.3f} {setup}  {status}")
+        for m in r.mismatches[:maxMismatches]:
+            where = "" if m.channel is None else f" channel {m.channel} sweep {m.sweep}"
+            lines.append(f"      {m.field}{where}: {m.message}")
+        if len(r.mismatches) > maxMismatches:
+            lines.append(f"      ... {len(r.mismatches) - maxMismatches} more")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pycedfs-verify',
+                                     description="Compare the metadata and data of CFS files across the pyCEDFS read paths.")
+    parser.add_argument('paths', nargs='+', help="CFS files or folders")
+    parser.add_argument('--backends', nargs='+', default=list(DEFAULT_BACKENDS), choices=BACKENDS)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--no-recursive', dest='recursive', action='store_false', help="Do not descend into subfolders")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    totals = collections.defaultdict(float)
+    files = [f for path in args.paths for f in find_files(path, recursive=args.recursive)]
+    for cfsFilePath in files:
+        try:
+            results = verify_file(cfsFilePath, backends=args.backends, workers=args.workers)
+        except Exception as e:
+            print(f"{cfsFilePath}\n  ERROR {type(e).__name__}: {e}")
+            failed += 1
+            continue
+        print(format_report(cfsFilePath, results))
+        for r in results:
+            totals[r.backend] += r.seconds
+        failed += any(r.error is not None or r.mismatches for r in results)
+
+    if len(files) > 1:
+        print(f"\n{len(files)} files, {failed} with problems. Total seconds per backend:")
+        for backend, seconds in totals.items():
+            print(f"  {backend:<10} {seconds:9.3f}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,6 +19,7 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     download_url = '',
+    python_requires='>=3.8',
     install_requires=[	
        'matplotlib>=2.1.0',
        'numpy>=1.17',
@@ -26,6 +27,8 @@ setup(
        'python_dateutil==2.8.1',
        'x_to_nwb==0.2.2'
 	],
+	entry_points={
+        'console_scripts': ['pycedfs-verify=pyCEDFS.verify:main']},
 	include_package_data=True,
 	package_data={
         
@@ -36,8 +39,9 @@ setup(
     'Topic :: Software Development ',
     'License :: OSI Approved :: MIT License',   
     'Programming Language :: Python :: 3',      
-    'Programming Language :: Python :: 3.4',
-    'Programming Language :: Python :: 3.5',
-    'Programming Language :: Python :: 3.6',
+    'Programming Language :: Python :: 3.8',
+    'Programming Language :: Python :: 3.9',
+    'Programming Language :: Python :: 3.10',
+    'Programming Language :: Python :: 3.11',
          ],
 )